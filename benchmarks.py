@@ -0,0 +1,219 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import print_function, unicode_literals
+
+import gc
+import glob
+import imp
+import io
+import json
+import os
+import shutil
+import sys
+import time
+import timeit
+
+import mock
+import simplemedia
+import xbmcaddon
+from future.utils import iteritems
+
+from fixtures import FixtureAdapter, use_fixtures, fixtures_dir
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+cwd = os.path.dirname(os.path.abspath(__file__))
+
+addon_name = 'plugin.video.russiatv1'
+sm_name = 'script.module.simplemedia'
+
+temp_dir = os.path.join(cwd, 'addon_data')
+
+if not os.path.exists(temp_dir):
+    os.mkdir(temp_dir)
+
+sm_dir = simplemedia.where()
+sm_config_dir = os.path.join(temp_dir, sm_name)
+xbmcaddon.init_addon(sm_dir, sm_config_dir)
+
+addon_dir = os.path.join(cwd, addon_name)
+addon_config_dir = os.path.join(temp_dir, addon_name)
+xbmcaddon.init_addon(addon_dir, addon_config_dir, True)
+
+# Import our module being benchmarked
+sys.path.append(addon_dir)
+
+from resources.libs import BrandInfo, RussiaTv  # noqa: E402
+from resources.libs.jsondecoder import decoders  # noqa: E402
+from resources.libs.russiatv1 import RussiaTvClient  # noqa: E402
+
+# Routes of the listing and playback hot paths, the same as in tests.py
+routes = [
+    ('root', '/', ''),
+    ('menu_serialy', '/menu/265/', '?offset=20&limit=10'),
+    ('menu_kino', '/menu/267/', ''),
+    ('brand_seasons', '/brand/9361/videos/', ''),
+    ('brand_episodes', '/brand/9361/videos/', '?limit=100&offset=0'),
+    ('play_movie', '/videos/1988947/', ''),
+    ('play_episode', '/videos/2248791/', ''),
+    ('play_trailer', '/videos/2221459/', ''),
+    ('menu_kino_atl', '/menu/267/', '?atl=1'),
+    ('brand_episodes_atl', '/brand/9361/videos/', '?limit=100&offset=0&atl=1'),
+    ('search_keyword', '/search/', '?keyword=Тайны следствия'),
+]
+
+# Brand description of the typical size and structure returned by /brands/
+brand_body = '\r\n'.join([
+    '<p>Сериал рассказывает о буднях врачей городской больницы.<br />'
+    'Главный герой - талантливый диагност с непростым характером.</p>',
+    '<p>Каждая серия - новая загадка, которую предстоит решить команде.</p>',
+    '<p>Режиссер-постановщик: Иван Иванов</p>',
+    '<p>Авторы сценария: Петр Петров, Сидор Сидоров и Анна Смирнова</p>',
+    '<p>Композитор: Алексей Кузнецов</p>',
+    '<p>Оператор: Михаил Попов</p>',
+    '<p>В ролях: Олег Васильев, Мария Павлова, Дмитрий Соколов, Елена Михайлова, Андрей Новиков, '
+    'Ольга Федорова и Сергей Морозов</p>',
+    '<p>Смотрите также: Вести</p>',
+    '<p>Официальный сайт проекта</p>',
+])
+
+
+def _get_peoples_reference(string):
+    """
+    Credit matcher implementation before the precompiled regular expression
+    """
+    peoples = {
+        'cast': ['В ролях: ', 'В главной роли: ', 'В главных ролях:', 'Текст читает: ', 'Ведущие: ', 'Ведущий: ',
+                 'Ведущая: '],
+        'director': ['Режиссер: ', 'Режиссеры: ', 'Режиссер-постановщик: '],
+        'writer': ['Авторы сценария: ', 'Автор сценария: ', 'Сценарий: '],
+        'other': ['Композитор: ', 'Оператор: '],
+    }
+
+    for prop, substrings in iteritems(peoples):
+        for substring in substrings:
+            if string.startswith(substring):
+                peoples = string[len(substring):].split(', ')
+                items = []
+                for people in peoples:
+                    parts = people.split(' и ')
+                    for part in parts:
+                        items.append(part)
+                return {prop: items}
+    return None
+
+
+def run_script():
+    imp.load_source('__main__', os.path.join(addon_dir, 'default.py'))
+
+
+def report(name, seconds, number):
+    print('{0:<40} {1:>10.2f} us'.format(name, seconds / number * 1000000))
+
+
+def bench_get_peoples(number=2000):
+    lines = [simplemedia.Addon().remove_html(line) for line in brand_body.split('\r\n')]
+
+    for line in lines:
+        assert BrandInfo._get_peoples(line) == _get_peoples_reference(line)
+
+    reference = timeit.timeit(lambda: [_get_peoples_reference(line) for line in lines], number=number)
+    compiled = timeit.timeit(lambda: [BrandInfo._get_peoples(line) for line in lines], number=number)
+
+    report('_get_peoples (reference), per body', reference, number)
+    report('_get_peoples (compiled), per body', compiled, number)
+    print('{0:<40} {1:>10.2f} x'.format('speedup', reference / compiled))
+
+
+def load_payloads():
+    """
+    Returns raw response bodies of the recorded fixtures, the largest first
+    """
+    payloads = []
+    for file_path in glob.glob(os.path.join(fixtures_dir, '*.json')):
+        with io.open(file_path, encoding='utf-8') as f:
+            fixture = json.load(f)
+        if fixture.get('json') is not None:
+            payloads.append(json.dumps(fixture['json'], ensure_ascii=False).encode('utf-8'))
+
+    return sorted(payloads, key=len, reverse=True)
+
+
+def bench_json_decoders(number=20):
+    """
+    Decodes the recorded payloads with every available decoder
+    """
+    payloads = load_payloads()
+    if not payloads:
+        print('No recorded fixtures in {0}'.format(fixtures_dir))
+        return
+
+    total = sum([len(payload) for payload in payloads])
+    print('{0} payloads, {1:.1f} KiB, the largest {2:.1f} KiB'.format(
+        len(payloads), total / 1024.0, len(payloads[0]) / 1024.0))
+
+    results = {}
+    for name, loads in iteritems(decoders):
+        for payload in payloads:
+            assert RussiaTvClient._extract_json(payload, loads) == json.loads(payload.decode('utf-8'))
+
+        results[name] = timeit.timeit(lambda: [RussiaTvClient._extract_json(payload, loads) for payload in payloads],
+                                      number=number)
+        report('_extract_json ({0}), all payloads'.format(name), results[name], number)
+
+    # Decoding before the raw bytes path
+    text = timeit.timeit(lambda: [json.loads(payload.decode('utf-8')) for payload in payloads], number=number)
+    report('json.loads (decoded text), all payloads', text, number)
+
+    for name, seconds in iteritems(results):
+        print('{0:<40} {1:>10.2f} x'.format('{0} speedup'.format(name), text / seconds))
+
+
+def bench_routes(mode='replay'):
+    """
+    Runs every route against recorded API responses with the response cache disabled
+
+    The live API is used with RUSSIATV_FIXTURES=live, missing fixtures are recorded with RUSSIATV_FIXTURES=record.
+    """
+    adapter = FixtureAdapter(mode=mode)
+
+    print('{0:<20} {1:>10} {2:>7} {3:>10} {4:>10}'.format('route', 'time, ms', 'calls', 'KiB', 'peak, KiB'))
+    with use_fixtures(adapter), \
+            mock.patch.object(RussiaTv, '_get_cache', staticmethod(lambda: None)):
+        for handle, (name, path, query) in enumerate(routes, 1):
+            argv = ['plugin://{0}{1}'.format(addon_name, path), str(handle), query]
+
+            adapter.calls = 0
+            adapter.bytes = 0
+            gc.collect()
+            if tracemalloc is not None:
+                tracemalloc.start()
+
+            start = time.time()
+            with mock.patch('simpleplugin.sys.argv', argv):
+                run_script()
+            elapsed = time.time() - start
+
+            peak = 0
+            if tracemalloc is not None:
+                peak = tracemalloc.get_traced_memory()[1]
+                tracemalloc.stop()
+
+            print('{0:<20} {1:>10.1f} {2:>7} {3:>10.1f} {4:>10.1f}'.format(
+                name, elapsed * 1000, adapter.calls, adapter.bytes / 1024.0, peak / 1024.0))
+
+
+def main():
+    try:
+        bench_get_peoples()
+        bench_json_decoders()
+        bench_routes(os.environ.get('RUSSIATV_FIXTURES', 'replay'))
+    finally:
+        shutil.rmtree(temp_dir, True)
+
+
+if __name__ == '__main__':
+    main()
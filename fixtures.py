@@ -0,0 +1,133 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import unicode_literals
+
+import hashlib
+import io
+import json
+import os
+
+import mock
+import requests
+from future.moves.urllib.parse import urlsplit, parse_qsl
+from requests.adapters import BaseAdapter, HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+
+__all__ = ['FixtureAdapter', 'use_fixtures']
+
+fixtures_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+
+# Response headers worth keeping in a fixture
+_saved_headers = ['Content-Type', 'ETag', 'Last-Modified']
+
+
+class FixtureAdapter(BaseAdapter):
+    """
+    Transport adapter, that replays recorded API responses from disk
+
+    In ``replay`` mode a response is looked up by the whole request first and
+    then by its url path, so one fixture of an endpoint answers all of its
+    pages and field profiles. A missing fixture is a connection error. In
+    ``record`` mode missing fixtures of requests are requested from the
+    network and saved, in ``live`` mode fixtures are not used at all.
+    """
+
+    def __init__(self, path=fixtures_dir, mode='replay'):
+        super(FixtureAdapter, self).__init__()
+
+        self._path = path
+        self._mode = mode
+        self._http = HTTPAdapter()
+
+        self.calls = 0
+        self.bytes = 0
+
+    @staticmethod
+    def make_name(request):
+        url_parts = urlsplit(request.url)
+
+        query = sorted(parse_qsl(url_parts.query, keep_blank_values=True))
+        key = '{0} {1}{2}?{3}'.format(request.method, url_parts.netloc, url_parts.path, query)
+
+        path = url_parts.path.strip('/').replace('/', '_')
+        return '{0}_{1}_{2}.json'.format(url_parts.netloc, path, hashlib.sha1(key.encode('utf-8')).hexdigest()[:12])
+
+    @staticmethod
+    def make_path_name(request):
+        url_parts = urlsplit(request.url)
+
+        path = url_parts.path.strip('/').replace('/', '_')
+        return '{0}_{1}.json'.format(url_parts.netloc, path)
+
+    def send(self, request, **kwargs):
+        self.calls += 1
+
+        names = {'replay': [self.make_name(request), self.make_path_name(request)],
+                 'record': [self.make_name(request)],
+                 }
+        fixture = self._load_fixture(names.get(self._mode, []))
+
+        if fixture is not None:
+            response = self._build_response(request, fixture)
+        elif self._mode in ['record', 'live']:
+            response = self._http.send(request, **kwargs)
+            if self._mode == 'record':
+                self._save_fixture(os.path.join(self._path, self.make_name(request)), response)
+        else:
+            raise requests.ConnectionError('No recorded fixture for {0}'.format(request.url), request=request)
+
+        self.bytes += len(response.content)
+        return response
+
+    def close(self):
+        self._http.close()
+
+    def _load_fixture(self, names):
+        for name in names:
+            file_path = os.path.join(self._path, name)
+            if os.path.exists(file_path):
+                with io.open(file_path, encoding='utf-8') as f:
+                    return json.load(f)
+
+    @staticmethod
+    def _build_response(request, fixture):
+        if fixture.get('json') is not None:
+            content = '{0}'.format(json.dumps(fixture['json'], ensure_ascii=False))
+        else:
+            content = fixture.get('text', '')
+
+        response = requests.Response()
+        response.status_code = fixture['status']
+        response.reason = fixture.get('reason', '')
+        response.headers = CaseInsensitiveDict(fixture['headers'])
+        response.encoding = 'utf-8'
+        response.url = request.url
+        response.request = request
+        response._content = content.encode('utf-8')
+
+        return response
+
+    def _save_fixture(self, file_path, response):
+        if not os.path.exists(self._path):
+            os.makedirs(self._path)
+
+        fixture = {'url': response.url,
+                   'status': response.status_code,
+                   'reason': response.reason,
+                   'headers': dict((name, response.headers[name]) for name in _saved_headers
+                                   if name in response.headers),
+                   }
+        try:
+            fixture['json'] = response.json()
+        except ValueError:
+            fixture['text'] = response.text
+
+        with io.open(file_path, 'w', encoding='utf-8') as f:
+            f.write('{0}'.format(json.dumps(fixture, ensure_ascii=False, indent=1, sort_keys=True)))
+
+
+def use_fixtures(adapter):
+    """
+    Returns a patcher, that mounts the adapter to every session of the API client
+    """
+    return mock.patch('resources.libs.russiatv1.HTTPAdapter', lambda **kwargs: adapter)
@@ -3,20 +3,44 @@
 
 from __future__ import unicode_literals
 
+import sys
+
 import simplemedia
 import xbmc
+import xbmcgui
 import xbmcplugin
+from future.utils import iteritems
 from simpleplugin import py2_decode
 
 from resources.libs import (RussiaTv, RussiaTvError,
-                            BrandInfo, SeasonInfo, VideoInfo,
-                            EmptyListItem, ListItem)
+                            BrandInfo, SeasonInfo, VideoInfo, BrandRecord, LibraryExporter,
+                            EmptyListItem, ListItem, FutureTimeout,
+                            tracer, write_trace, get_catalogue,
+                            get_episode_index, update_episode_index, get_image_policy, use_throughput,
+                            remember_brand, remember_season,
+                            remember_episodes, preresolve_videos, get_resolved_video, get_next_episode,
+                            get_library_exporter, get_library_brand, get_exported_brands, get_all_brands,
+                            export_brands)
 
 plugin = simplemedia.RoutedPlugin()
 _ = plugin.initialize_gettext()
 
+# Adaptive stream sources and their manifest types of inputstream.adaptive by preference
+_manifest_sources = [('m3u8', 'hls'), ('dash', 'mpd')]
+# MP4 presets of video qualities from the lowest one
+_mp4_presets = [['low', 'low-wide'],
+                ['medium', 'medium-wide'],
+                ['high-wide', 'high'],
+                ['hd', 'hd-wide'],
+                ['fhd', 'fhd-wide'],
+                ]
+# The largest page size of the /videos/ API method
+_max_videos_limit = 1000
+
 BrandInfo.plugin = plugin
+BrandInfo.image_policy = get_image_policy()
 EmptyListItem.plugin = plugin
+LibraryExporter.plugin = plugin
 
 
 @plugin.route('/')
@@ -39,6 +63,7 @@ def _list_root():
                          'is_folder': True,
                          'is_playble': False,
                          'content_lookup': False,
+                         'context_menu': _get_library_menu('library_menu', menu_id=menu_item['id']),
                          }
             yield list_item
 
@@ -63,10 +88,10 @@ def menu(menu_id):
 
     limit = plugin.params.limit
     if not limit:
-        limit = plugin.get_setting('limit', False)
+        limit = RussiaTv.get_instance().page_size('brands', 'limit')
     limit = int(limit)
     try:
-        brand_result = RussiaTv().brands(menu_info['tags'], limit, offset)
+        brand_result = RussiaTv.get_instance().brands(menu_info['tags'], limit, offset)
     except (RussiaTvError, simplemedia.WebClientError) as e:
         plugin.notify_error(e)
         plugin.create_directory([], succeeded=False)
@@ -89,32 +114,110 @@ def menu(menu_id):
                   }
         plugin.create_directory(**result)
 
+        if pages['next'] is not None:
+            api = RussiaTv.get_instance()
+            _prefetch_next_page(_prefetch_brands, api.brands, menu_info['tags'], limit, offset + 1)
+
 
 def _list_brands(brands, pages):
     use_atl_names = _use_atl_names()
 
-    for brand_info in brands:
-        item_info = BrandInfo(brand_info, atl_names=use_atl_names)
-        if item_info.mediatype == 'movie':
-            video_info = _get_movie_video_info(brand_info['id'], brand_info['sortBy'])
-            item_info.set_video_info(video_info)
+    with tracer.stage('brand_info'):
+        items_info = [BrandInfo(brand_info, atl_names=use_atl_names) for brand_info in brands]
 
-        if brand_info['countVideos'] > brand_info['countFullVideos']:
-            trailer_url = _get_trailer_url(brand_info['id'])
-            item_info.set_trailer(trailer_url)
+    movie_ids, trailer_ids, trailers_limit = _get_extras_params(items_info)
 
-        listitem = ListItem(item_info)
+    # Items are built while the enrichment is requested, only items that need it wait for it
+    enrichment = RussiaTv.get_instance().submit(_get_brands_extras, movie_ids, trailer_ids, trailers_limit)
+    timeout = plugin.get_setting('enrichment_timeout')
 
-        url = _get_listitem_url(item_info, use_atl_names)
-        listitem.set_url(url)
+    extras = None
+    for item_info in items_info:
+        if extras is None \
+                and (item_info.mediatype == 'movie' or item_info.brand_id in trailer_ids):
+            extras = _get_enrichment(enrichment, timeout, item_info.brand_id)
+
+        with tracer.stage('list_items'):
+            if extras is not None:
+                _set_extras(item_info, *extras)
+
+            listitem = ListItem(item_info)
+
+            url = _get_listitem_url(item_info, use_atl_names)
+            listitem.set_url(url)
 
-        yield listitem.get_item()
+            item = listitem.get_item()
+            item['context_menu'] = _get_library_menu('library_brand', brand_id=item_info.brand_id)
+
+        yield item
 
     if pages is not None:
         for listitem in _page_items(pages):
             yield listitem
 
 
+def _get_enrichment(enrichment, timeout, brand_id):
+    """
+    Returns a tuple of movie videos and trailer urls, waits for them up to the deadline of an item
+
+    None is returned on timeout, the enrichment may still be received for the next items.
+    """
+    with tracer.stage('enrichment'):
+        try:
+            return enrichment.result(timeout or None)
+        except FutureTimeout:
+            plugin.log_warning('Details of brand {0} were not received in {1} s'.format(brand_id, timeout))
+        except (RussiaTvError, simplemedia.WebClientError) as e:
+            plugin.log_error('Failed to get item details: {0}'.format(e))
+            return {}, {}
+
+
+def _set_extras(item_info, movies_video_info, trailers_url):
+    if item_info.mediatype == 'movie':
+        video_info = movies_video_info.get(item_info.brand_id)
+        if video_info is not None:
+            item_info.set_video_info(video_info)
+
+    trailer_url = trailers_url.get(item_info.brand_id)
+    if trailer_url is not None:
+        item_info.set_trailer(trailer_url)
+
+
+def _get_extras_params(items_info):
+    movie_ids = []
+    trailer_ids = []
+    trailers_limit = 0
+    for item_info in items_info:
+        brand_info = item_info.brand_info
+        if item_info.mediatype == 'movie':
+            movie_ids.append((item_info.brand_id, brand_info.sort_by))
+        if brand_info.count_videos > brand_info.count_full_videos:
+            trailer_ids.append(item_info.brand_id)
+            trailers_limit += brand_info.count_videos - brand_info.count_full_videos
+
+    return movie_ids, trailer_ids, min(trailers_limit, _max_videos_limit)
+
+
+def _prefetch_next_page(func, *args):
+    # Runs after the directory has been sent to Kodi, the plugin waits for it before exit
+    if plugin.get_setting('prefetch_next_page'):
+        RussiaTv.get_instance().submit_background(func, *args)
+
+
+def _prefetch_brands(func, *args):
+    brands = func(*args)['data']
+
+    items_info = [BrandInfo(brand_info) for brand_info in brands]
+    _get_brands_extras(*_get_extras_params(items_info))
+
+
+def _prefetch_next_videos(brand_id, sort, limit, offset):
+    # Without the response cache a prefetched page of videos would be thrown away
+    api = RussiaTv.get_instance()
+    if api.has_cache:
+        _prefetch_next_page(api.videos, brand_id, sort, limit, offset)
+
+
 @plugin.route('/brand/<int:brand_id>/videos/')
 def brand_videos(brand_id):
     if plugin.params.offset is None:
@@ -124,42 +227,65 @@ def brand_videos(brand_id):
 
 
 def brand_seasons(brand_id):
-    limit = plugin.get_setting('season_limit')
+    limit = RussiaTv.get_instance().page_size('videos', 'season_limit')
+    remember_brand(brand_id)
     try:
-        api = RussiaTv()
-        brand_info = api.brand_info(brand_id)
-        videos = api.videos(brand_id, brand_info['sortBy'])
+        brand_info, total_videos = _get_brand_summary(brand_id)
     except (RussiaTvError, simplemedia.WebClientError) as e:
         plugin.notify_error(e)
         plugin.create_directory([], succeeded=False)
     else:
-        total_videos = videos['pagination']['totalCount']
-        result = {'items': _list_seasons(brand_info, limit, total_videos),
-                  'total_items': int(total_videos / limit),
+        brand_info = BrandRecord(brand_info)
+        episode_index = _get_episode_index(brand_id, brand_info.sort_by, total_videos)
+
+        # Library scans of the use_atl_names mode get only season folders
+        jump_item = episode_index is not None and not _use_atl_names()
+
+        result = {'items': _list_seasons(brand_info, limit, total_videos, episode_index, jump_item),
+                  'total_items': int(total_videos / limit) + int(jump_item),
                   'content': 'seasons',
-                  'category': brand_info['title'],
+                  'category': brand_info.title,
                   'sort_methods': {'sortMethod': xbmcplugin.SORT_METHOD_UNSORTED, 'label2Mask': '%Y / %O'},
                   }
         plugin.create_directory(**result)
 
+        _prefetch_next_videos(brand_id, brand_info.sort_by, limit, 0)
 
-def _list_seasons(brand_info, limit, total_episodes):
+
+def _list_seasons(brand_info, limit, total_episodes, episode_index=None, jump_item=False):
     use_atl_names = _use_atl_names()
 
+    if jump_item:
+        url = plugin.url_for('brand_jump', brand_id=brand_info.id, limit=limit)
+        listitem = {'label': _('Go to episode...'),
+                    'fanart': plugin.fanart,
+                    'is_folder': True,
+                    'url': url,
+                    'properties': {'SpecialSort': 'top'},
+                    'content_lookup': False,
+                    }
+        yield listitem
+
     season_info = SeasonInfo(brand_info, limit, total_episodes)
 
     offset = 0
     while (offset * limit) + 1 < total_episodes:
-        season_info.set_offset(offset)
+        with tracer.stage('list_items'):
+            series_range = None
+            if episode_index is not None:
+                series_range = episode_index.series_range(brand_info.id, brand_info.sort_by, offset * limit, limit)
+            season_info.set_offset(offset, series_range)
 
-        listitem = ListItem(season_info)
+            listitem = ListItem(season_info)
 
-        url = _get_listitem_url(season_info, use_atl_names)
-        listitem.set_url(url)
+            url = _get_listitem_url(season_info, use_atl_names)
+            listitem.set_url(url)
 
-        offset += 1
+            offset += 1
 
-        yield listitem.get_item()
+            item = listitem.get_item()
+
+        yield item
 
 
 def brand_episodes(brand_id):
@@ -171,14 +297,27 @@ def brand_episodes(brand_id):
         limit = plugin.get_setting('season_limit', False)
     limit = int(limit)
     try:
-        api = RussiaTv()
-        brand_info = api.brand_info(brand_id)
-        videos = api.videos(brand_id, brand_info['sortBy'], limit, offset)
+        api = RussiaTv.get_instance()
+        # Season urls carry the sort order, so the page is requested together with the brand info
+        sort = plugin.params.sort
+        if sort:
+            future = api.submit(api.videos, brand_id, sort, limit, offset, paged=True)
+            brand_info, total_videos = _get_brand_summary(brand_id)
+            videos = future.result()
+        else:
+            brand_info, total_videos = _get_brand_summary(brand_id)
+            sort = brand_info['sortBy']
+            videos = api.videos(brand_id, sort, limit, offset, paged=True)
     except (RussiaTvError, simplemedia.WebClientError) as e:
         plugin.notify_error(e)
         plugin.create_directory([], succeeded=False)
     else:
-        category_parts = [brand_info['title'],
+        remember_season(brand_id, sort, limit, offset)
+
+        # One record is shared by all episodes of the page
+        brand_info = BrandRecord(brand_info)
+
+        category_parts = [brand_info.title,
                           '{0} {1}-{2}'.format(_('Episodes'), (offset * limit) + 1,
                                                (offset * limit) + len(videos['data']))]
 
@@ -196,36 +335,129 @@ def brand_episodes(brand_id):
                   }
         plugin.create_directory(**result)
 
+        if (offset + 1) * limit < total_videos:
+            _prefetch_next_videos(brand_id, sort, limit, offset + 1)
+
+        _preresolve_episodes(videos['data'])
+
+
+def _preresolve_episodes(videos):
+    # The first episodes of a page are the most likely to be played
+    preresolve_count = plugin.get_setting('preresolve_count')
+    if not preresolve_count:
+        return
+
+    video_ids = [video['id'] for video in videos]
+    remember_episodes(video_ids)
+    if video_ids:
+        api = RussiaTv.get_instance()
+        api.submit_background(preresolve_videos, api, video_ids[:preresolve_count])
+
 
 def _list_episodes(brand_info, videos, offset, limit):
     use_atl_names = _use_atl_names()
 
     episode = offset * limit
     for video_item in videos:
-        video_info = VideoInfo(brand_info, video_item, atl_names=use_atl_names)
-        episode += 1
-        video_info.set_episode(episode)
+        with tracer.stage('list_items'):
+            video_info = VideoInfo(brand_info, video_item, atl_names=use_atl_names)
+            episode += 1
+            video_info.set_episode(episode)
 
-        listitem = ListItem(video_info)
+            listitem = ListItem(video_info)
 
-        url = _get_listitem_url(video_info, use_atl_names)
-        listitem.set_url(url)
+            url = _get_listitem_url(video_info, use_atl_names)
+            listitem.set_url(url)
 
-        yield listitem.get_item()
+            item = listitem.get_item()
 
+        yield item
+
+
+@plugin.route('/brand/<int:brand_id>/episode/')
+def brand_jump(brand_id):
+    limit = plugin.params.limit
+    if not limit:
+        limit = plugin.get_setting('season_limit', False)
+    limit = int(limit)
+
+    episode = plugin.get_keyboard_text('', _('Episode number'))
+    if not episode \
+            or not episode.isdigit():
+        plugin.create_directory([], succeeded=False)
+        return
+    episode = int(episode)
+
+    try:
+        brand_info, total_videos = _get_brand_summary(brand_id)
+    except (RussiaTvError, simplemedia.WebClientError) as e:
+        plugin.notify_error(e)
+        plugin.create_directory([], succeeded=False)
+        return
+
+    sort = brand_info['sortBy']
+
+    position = None
+    episode_index = _get_episode_index(brand_id, sort, total_videos)
+    if episode_index is not None:
+        position = episode_index.find(brand_id, sort, episode)
+    # Episodes without numbers are numbered by position, as in the listing
+    if position is None \
+            and 0 < episode <= total_videos:
+        position = episode - 1
+
+    plugin.create_directory([], succeeded=False)
+
+    if position is None:
+        plugin.notify_error(_('Episode not found'))
+        return
+
+    ext_dir_params = {'atl': 1} if _use_atl_names() else {}
+    url = plugin.url_for('brand_videos', brand_id=brand_id, offset=position // limit, limit=limit, sort=sort,
+                         **ext_dir_params)
+    xbmc.executebuiltin('Container.Update("%s")' % url)
 
-@plugin.mem_cached(180)
-def _get_menu_items():
-    api = RussiaTv()
 
-    menu_result = api.menu()
-    menu_items = menu_result['data']
+def _get_episode_index(brand_id, sort, total_videos):
+    """
+    Returns the episode index, if all episodes of the brand are indexed
 
-    if menu_result['pagination']['totalCount'] > menu_result['pagination']['limit']:
-        offset = menu_result['pagination']['limit']
-        limit = menu_result['pagination']['totalCount'] - offset
-        menu_result = api.menu(limit, offset)
-        menu_items.extend(menu_result['data'])
+    Otherwise the index is updated in background and listings use offset ranges until it is ready.
+    """
+    if not plugin.get_setting('episode_index'):
+        return None
+
+    episode_index = get_episode_index()
+    if episode_index.count(brand_id, sort) == total_videos:
+        return episode_index
+
+    RussiaTv.get_instance().submit_background(_update_episode_index, episode_index, brand_id, sort, total_videos)
+    return None
+
+
+def _update_episode_index(episode_index, brand_id, sort, total_videos):
+    # Runs along with the listing, the plugin waits for it before exit
+    try:
+        with tracer.stage('episode_index'):
+            update_episode_index(RussiaTv.get_instance(), episode_index, brand_id, sort, total_videos)
+    except (RussiaTvError, simplemedia.WebClientError) as e:
+        plugin.log_error('Failed to update the episode index: {0}'.format(e))
+
+
+@plugin.cached(60)
+def _get_brand_summary(brand_id):
+    api = RussiaTv.get_instance()
+
+    # Only pagination is needed from videos, so the sort order does not matter
+    brand_info, videos = api.gather((api.brand_info, brand_id),
+                                    (api.videos, brand_id, 'date', 1, 0, 1, ['id']))
+
+    return brand_info, videos['pagination']['totalCount']
+
+
+@plugin.mem_cached(180)
+def _get_menu_items():
+    menu_items = RussiaTv.get_instance().menu_all()
 
     movie_icon = plugin.get_image('DefaultMovies.png')
     tvshow_icon = plugin.get_image('DefaultTVShows.png')
@@ -262,14 +494,16 @@ def play_video(video_id):
 
     try:
         if video_id == 0:
-            raise RussiaTvError(_('Video not found'))
-
-        api = RussiaTv()
+            video_id = _get_movie_video_id(plugin.params.brand_id)
 
-        api.check_video_access(video_id)
+        if video_id == 0:
+            raise RussiaTvError(_('Video not found'))
 
-        video_info = api.video(video_id)
-        brand_info = api.brand_info(video_info['brandId'])
+        resolved = get_resolved_video(video_id)
+        if resolved is not None:
+            video_info, brand_info = resolved
+        else:
+            video_info, brand_info = RussiaTv.get_instance().resolve_video(video_id)
 
         video_item = VideoInfo(brand_info, video_info, True)
 
@@ -288,13 +522,15 @@ def play_video(video_id):
         url = plugin.url_for('play_video', video_id=video_id)
         listitem.set_url(url)
 
-        stream_url = _get_video_url(video_info['sources'])
+        stream_url, stream_properties = _get_video_url(video_info['sources'])
 
         if not stream_url:
             plugin.notify_error(_('Video not found'))
             succeeded = False
         else:
             listitem.set_path(stream_url)
+            listitem.set_stream_properties(stream_properties)
+            _probe_stream(stream_url, stream_properties)
 
         is_trailer = (video_info['videoType'] == 3)
 
@@ -304,6 +540,84 @@ def play_video(video_id):
 
     plugin.resolve_url(listitem.get_item(), succeeded)
 
+    if succeeded:
+        _preresolve_next_episode(video_id)
+
+
+def _probe_stream(stream_url, stream_properties):
+    # Runs along with the start of the playback, so the estimate is a conservative one.
+    # Adaptive streams choose their quality themselves.
+    if use_throughput() \
+            and not stream_properties:
+        RussiaTv.get_instance().submit_background(_sample_throughput, stream_url)
+
+
+def _sample_throughput(stream_url):
+    try:
+        RussiaTv.get_instance().probe_stream(stream_url)
+    except (RussiaTvError, simplemedia.WebClientError) as e:
+        plugin.log_warning('Failed to measure the throughput: {0}'.format(e))
+
+
+def _preresolve_next_episode(video_id):
+    # Runs after the playback has started, the plugin waits for it before exit
+    if not plugin.get_setting('preresolve_count'):
+        return
+
+    next_video_id = get_next_episode(video_id)
+    if next_video_id is not None \
+            and get_resolved_video(next_video_id) is None:
+        api = RussiaTv.get_instance()
+        api.submit_background(preresolve_videos, api, [next_video_id])
+
+
+@plugin.route('/library/brand/<int:brand_id>/')
+def library_brand(brand_id):
+    _export_to_library(lambda api: [get_library_brand(api, brand_id)])
+
+
+@plugin.route('/library/menu/<int:menu_id>/')
+def library_menu(menu_id):
+    menu_info = _menu_info(menu_id)
+    _export_to_library(get_all_brands, menu_info['tags'])
+
+
+@plugin.route('/library/update/')
+def library_update():
+    # Started by the service, new files are reported by the library scan
+    api = RussiaTv.get_instance()
+    exporter = get_library_exporter()
+    try:
+        with tracer.stage('library'):
+            written = export_brands(api, exporter, get_exported_brands(api, exporter))
+    except (RussiaTvError, simplemedia.WebClientError) as e:
+        plugin.log_error('Failed to update the library: {0}'.format(e))
+        return
+
+    if written:
+        xbmc.executebuiltin('UpdateLibrary(video)')
+
+
+def _export_to_library(get_brands, *args):
+    api = RussiaTv.get_instance()
+    exporter = get_library_exporter()
+    try:
+        with tracer.stage('library'):
+            written = export_brands(api, exporter, get_brands(api, *args))
+    except (RussiaTvError, simplemedia.WebClientError) as e:
+        plugin.notify_error(e)
+        return
+
+    xbmcgui.Dialog().notification(plugin.name, _('Files written to the library: {0}').format(written),
+                                  plugin.icon)
+    if written:
+        xbmc.executebuiltin('UpdateLibrary(video)')
+
+
+def _get_library_menu(action, **kwargs):
+    url = plugin.url_for(action, **kwargs)
+    return [(_('Export to library'), 'RunPlugin({0})'.format(url))]
+
 
 @plugin.route('/search/history/')
 def search_history():
@@ -349,11 +663,17 @@ def search():
 
         limit = plugin.params.limit
         if not limit:
-            limit = '9999' if is_usearch else plugin.get_setting('limit', False)
+            limit = '9999' if is_usearch else RussiaTv.get_instance().page_size('brands_search', 'limit')
         limit = int(limit)
 
+        catalogue = get_catalogue() if plugin.get_setting('local_search') else None
+
+        local_result = catalogue is not None and catalogue.updated
         try:
-            search_result = RussiaTv().brands_search(keyword, limit, offset)
+            if local_result:
+                search_result = catalogue.search(keyword, limit, offset)
+            else:
+                search_result = RussiaTv.get_instance().brands_search(keyword, limit, offset)
         except (RussiaTvError, simplemedia.WebClientError) as e:
             plugin.notify_error(e)
             plugin.create_directory([], succeeded=False)
@@ -376,6 +696,11 @@ def search():
                       }
             plugin.create_directory(**result)
 
+            if pages['next'] is not None \
+                    and not local_result:
+                api = RussiaTv.get_instance()
+                _prefetch_next_page(_prefetch_brands, api.brands_search, keyword, limit, offset + 1)
+
 
 def _menu_info(menu_id):
     for menu_item in _get_menu_items():
@@ -392,6 +717,11 @@ def _get_pages(page_params, offset, limit, total, action):
                          'limit': limit,
                          }
             prev_page.update(page_params)
+        elif plugin.get_setting('adaptive_page_size'):
+            # Keeps the page size chosen for the listing
+            prev_page = {'limit': limit,
+                         }
+            prev_page.update(page_params)
         else:
             prev_page = page_params
     else:
@@ -451,14 +781,18 @@ def _get_listitem_url(item_info, use_atl_names=False):
         ext_dir_params['atl'] = 1
         ext_item_params['strm'] = 1
 
-    if item_info.mediatype in ['movie', 'episode']:
+    if item_info.mediatype == 'movie' \
+            and not item_info.video_id:
+        url = plugin.url_for('play_video', video_id=0, brand_id=item_info.brand_id,
+                             **ext_item_params)
+    elif item_info.mediatype in ['movie', 'episode']:
         url = plugin.url_for('play_video', video_id=item_info.video_id,
                              **ext_item_params)
     elif item_info.mediatype == 'tvshow':
         url = plugin.url_for('brand_videos', brand_id=item_info.brand_id, **ext_dir_params)
     elif item_info.mediatype == 'season':
         url = plugin.url_for('brand_videos', brand_id=item_info.brand_id, offset=item_info.offset,
-                             limit=item_info.limit, **ext_dir_params)
+                             limit=item_info.limit, sort=item_info.brand_info.sort_by, **ext_dir_params)
     else:
         url = None
 
@@ -466,62 +800,102 @@ def _get_listitem_url(item_info, use_atl_names=False):
 
 
 @plugin.cached(180)
-def _get_trailer_url(brand_id):
-    videos = RussiaTv().videos(brand_id, 'date', video_type=3, includes=['id'])
-    if videos['pagination']['totalCount'] > 0:
-        trailer_url = plugin.url_for('play_video', video_id=videos['data'][0]['id'])
-        return trailer_url
+def _get_brands_extras(movie_ids, trailer_ids, trailers_limit):
+    api = RussiaTv.get_instance()
 
+    # A movie brand has a single full video, so one request covers all movies with the same sort order
+    movie_sorts = {}
+    for brand_id, sort in movie_ids:
+        movie_sorts.setdefault(sort or 'date', []).append(brand_id)
 
-@plugin.cached(180)
-def _get_movie_video_info(brand_id, order):
-    videos = RussiaTv().videos(brand_id, order, includes=['id', 'duration'])
-    if videos['data']:
-        result = videos['data'][0]
-    else:
-        result = {'id': 0,
-                  'duration': 0
-                  }
-    return result
+    calls = []
+    for sort, brand_ids in iteritems(movie_sorts):
+        calls.append((api.videos, brand_ids, sort, len(brand_ids), 0, 1, ['id', 'duration', 'brandId']))
+    if trailer_ids:
+        calls.append((api.videos, trailer_ids, 'date', trailers_limit, 0, 3, ['id', 'brandId']))
+
+    results = api.gather(*calls)
+
+    movies_video_info = {}
+    for result in results[:len(movie_sorts)]:
+        for video in result['data']:
+            if video['brandId'] not in movies_video_info:
+                movies_video_info[video['brandId']] = video
+
+    trailers_url = {}
+    if trailer_ids:
+        # The first trailer by date wins
+        for video in results[-1]['data']:
+            if video['brandId'] not in trailers_url:
+                trailers_url[video['brandId']] = plugin.url_for('play_video', video_id=video['id'])
+
+    return movies_video_info, trailers_url
+
+
+def _get_movie_video_id(brand_id):
+    # Movies listed without item details are resolved on play
+    if brand_id:
+        videos = RussiaTv.get_instance().videos(int(brand_id), 'date', includes=['id'])
+        if videos['data']:
+            return videos['data'][0]['id']
+    return 0
 
 
 def _get_video_url(sources):
-    video_quality = plugin.get_setting('video_quality')
+    """
+    Returns a tuple of the stream url and listitem properties of inputstream.adaptive
+    """
+    if plugin.get_setting('adaptive_streaming') \
+            and _has_inputstream_adaptive():
+        for source_type, manifest_type in _manifest_sources:
+            path = _get_manifest_url(sources.get(source_type))
+            if path:
+                return path, _get_inputstream_properties(manifest_type)
 
+    sources_mp4 = sources.get('mp4')
+    if sources_mp4 is None:
+        return '', {}
+
+    video_quality = RussiaTv.get_instance().video_quality()
+
+    # The last available preset up to the video quality wins, the lowest available one otherwise
     path = ''
+    for quality, presets in enumerate(_mp4_presets):
+        for preset in presets:
+            if (not path or video_quality >= quality) and sources_mp4.get(preset):
+                path = sources_mp4[preset]
 
-    sources_mp4 = sources.get('mp4')
+    return path, {}
 
-    if sources_mp4 is None:
-        return path
 
-    if (not path or video_quality >= 0) and sources_mp4.get('low'):
-        path = sources_mp4['low']
-    if (not path or video_quality >= 0) and sources_mp4.get('low-wide'):
-        path = sources_mp4['low-wide']
+def _get_manifest_url(source):
+    if isinstance(source, dict):
+        return source.get('auto') or next(iter(source.values()), None)
+    return source
 
-    if (not path or video_quality >= 1) and sources_mp4.get('medium'):
-        path = sources_mp4['medium']
-    if (not path or video_quality >= 1) and sources_mp4.get('medium-wide'):
-        path = sources_mp4['medium-wide']
 
-    if (not path or video_quality >= 2) and sources_mp4.get('high-wide'):
-        path = sources_mp4['high-wide']
-    if (not path or video_quality >= 2) and sources_mp4.get('high'):
-        path = sources_mp4['high']
+def _has_inputstream_adaptive():
+    return plugin.kodi_major_version() >= '17' \
+           and xbmc.getCondVisibility('System.HasAddon(inputstream.adaptive)') \
+           and xbmc.getCondVisibility('System.AddonIsEnabled(inputstream.adaptive)')
 
-    if (not path or video_quality >= 3) and sources_mp4.get('hd'):
-        path = sources_mp4['hd']
-    if (not path or video_quality >= 3) and sources_mp4.get('hd-wide'):
-        path = sources_mp4['hd-wide']
 
-    if (not path or video_quality >= 4) and sources_mp4.get('fhd'):
-        path = sources_mp4['fhd']
-    if (not path or video_quality >= 4) and sources_mp4.get('fhd-wide'):
-        path = sources_mp4['fhd-wide']
+def _get_inputstream_properties(manifest_type):
+    if plugin.kodi_major_version() >= '19':
+        inputstream_property = 'inputstream'
+    else:
+        inputstream_property = 'inputstreamaddon'
 
-    return path
+    return {inputstream_property: 'inputstream.adaptive',
+            'inputstream.adaptive.manifest_type': manifest_type,
+            }
 
 
 if __name__ == '__main__':
-    plugin.run()
+    tracer.reset()
+    try:
+        with tracer.stage('route'):
+            plugin.run()
+    finally:
+        RussiaTv.release_instance()
+        write_trace(sys.argv[0] + sys.argv[2])
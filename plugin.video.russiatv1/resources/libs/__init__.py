@@ -3,23 +3,105 @@
 
 from __future__ import unicode_literals
 
+import os
+import re
+import threading
+
 import simplemedia
 import xbmc
-import os
+from future.moves.http.cookiejar import LWPCookieJar
 
+from .adaptive import PageSizer, ThroughputMeter
+from .cache import ResponseCache
+from .catalogue import get_catalogue, update_catalogue
+from .episodes import get_episode_index, update_episode_index
+from .executor import FutureTimeout
+from .library import (LibraryExporter, get_library_exporter, get_library_brand, get_exported_brands, get_all_brands,
+                      export_brands)
 from .listitems import BrandInfo, SeasonInfo, VideoInfo, EmptyListItem, ListItem
+from .preresolve import remember_episodes, preresolve_videos, get_resolved_video, get_next_episode
+from .records import BrandRecord, VideoRecord
 from .russiatv1 import RussiaTvClient, RussiaTvError
+from .tracing import tracer, write_trace
+from .warmup import remember_brand, remember_season, get_recent
 
 __all__ = ['RussiaTv', 'RussiaTvError',
-           'BrandInfo', 'SeasonInfo', 'VideoInfo', 'EmptyListItem', 'ListItem']
+           'BrandInfo', 'SeasonInfo', 'VideoInfo', 'EmptyListItem', 'ListItem', 'FutureTimeout',
+           'BrandRecord', 'VideoRecord', 'LibraryExporter',
+           'tracer', 'write_trace', 'get_catalogue', 'update_catalogue',
+           'get_episode_index', 'update_episode_index', 'get_image_policy', 'use_throughput',
+           'remember_brand', 'remember_season', 'get_recent',
+           'remember_episodes', 'preresolve_videos', 'get_resolved_video', 'get_next_episode',
+           'get_library_exporter', 'get_library_brand', 'get_exported_brands', 'get_all_brands', 'export_brands']
 
 addon = simplemedia.Addon()
 
+# Minimum, maximum and step of page size settings, the same as the sliders of settings.xml
+_page_size_ranges = {'limit': (5, 100, 5),
+                     'season_limit': (10, 1000, 10),
+                     }
+
+# Approximate bitrates of video qualities in kbit/s and the throughput reserve of the automatic quality
+_video_bitrates = [400, 800, 1500, 2500, 4500]
+_bitrate_headroom = 1.5
+
+# Devices with less memory get reduced artwork with the automatic image policy, MB
+_low_memory = 2048
+# Links with less throughput get reduced and minimal artwork with the automatic image policy, kbit/s
+_low_throughput = 4000
+_minimal_throughput = 1000
+
+
+def get_image_policy():
+    """
+    Returns the image policy of BrandInfo, the automatic one depends on the device memory
+    and the measured throughput
+    """
+    # image_policy: 0 - full size, 1 - reduced, 2 - minimal, 3 - auto
+    image_policy = addon.get_setting('image_policy')
+    if image_policy != 3:
+        return image_policy
+
+    image_policy = 0
+
+    memory = re.match(r'\d+', xbmc.getInfoLabel('System.Memory(total)') or '')
+    if memory is not None \
+            and int(memory.group(0)) < _low_memory:
+        image_policy = 1
+
+    with addon.get_storage('__throughput__.pcl') as storage:
+        throughput = ThroughputMeter(storage.get('samples')).throughput()
+    if throughput is not None:
+        kbits = throughput * 8 / 1000.0
+        if kbits < _minimal_throughput:
+            image_policy = 2
+        elif kbits < _low_throughput:
+            image_policy = max(image_policy, 1)
+
+    return image_policy
+
+
+def use_throughput():
+    """
+    Returns True, if the throughput is measured for the automatic video quality or image policy
+    """
+    return addon.get_setting('video_quality') == 5 or addon.get_setting('image_policy') == 3
+
 
 class RussiaTv(RussiaTvClient):
+    _transport_errors = (simplemedia.WebClientError,)
+
+    _instance = None
+    _instance_lock = threading.Lock()
 
     def __init__(self):
         params = {'channels': 1,
+                  'max_workers': addon.get_setting('max_workers'),
+                  'cache': self._get_cache(),
+                  'stale_while_revalidate': addon.get_setting('stale_while_revalidate'),
+                  'tracer': tracer,
+                  'page_sizer': self._load_page_sizer(),
+                  'throughput_meter': self._load_throughput_meter(),
                   }
 
         super(RussiaTv, self).__init__(**params)
@@ -28,6 +110,93 @@ def __init__(self):
         if addon.kodi_major_version() >= '17':
             headers['User-Agent'] = xbmc.getUserAgent()
 
+        session = simplemedia.WebClient(headers)
+        session.cookies = self._load_cookies()
+
+        self._init_session(session)
+
+    @classmethod
+    def get_instance(cls):
+        """
+        Returns the client shared by the whole plugin invocation
+        """
+        with cls._instance_lock:
+            if cls._instance is None:
+                cls._instance = cls()
+            return cls._instance
+
+    @classmethod
+    def release_instance(cls):
+        with cls._instance_lock:
+            instance = cls._instance
+            cls._instance = None
+
+        if instance is not None:
+            instance.close()
+
+    def close(self):
+        if self._client is not None:
+            cookies = self._client.cookies
+            super(RussiaTv, self).close()
+            cookies.save(ignore_discard=True, ignore_expires=True)
+
+            if addon.get_setting('adaptive_page_size'):
+                with addon.get_storage('__page_size__.pcl') as storage:
+                    storage['samples'] = self.page_sizer.samples
+
+            if use_throughput():
+                with addon.get_storage('__throughput__.pcl') as storage:
+                    storage['samples'] = self.throughput_meter.samples
+
+    def page_size(self, endpoint, setting_id):
+        """
+        Returns the page size from settings or the adaptive one
+        """
+        default = addon.get_setting(setting_id)
+        if not addon.get_setting('adaptive_page_size'):
+            return default
+
+        target = addon.get_setting('adaptive_target')
+        minimum, maximum, step = _page_size_ranges[setting_id]
+        return self.page_sizer.page_size(endpoint, target, minimum, maximum, step, default)
+
+    def video_quality(self):
+        """
+        Returns the video quality from settings or the one, that the measured throughput sustains
+
+        video_quality: 0 - 240p, 1 - 360p, 2 - 540p, 3 - 720p, 4 - 1080p, 5 - auto
+        """
+        video_quality = addon.get_setting('video_quality')
+        if video_quality != 5:
+            return video_quality
+
+        return self.throughput_meter.quality(_video_bitrates, _bitrate_headroom, 2)
+
+    @staticmethod
+    def _load_page_sizer():
+        if addon.get_setting('adaptive_page_size'):
+            with addon.get_storage('__page_size__.pcl') as storage:
+                return PageSizer(storage.get('samples'))
+
+    @staticmethod
+    def _load_throughput_meter():
+        if use_throughput():
+            with addon.get_storage('__throughput__.pcl') as storage:
+                return ThroughputMeter(storage.get('samples'))
+
+    @staticmethod
+    def _load_cookies():
         cookie_file = os.path.join(addon.profile_dir, 'russiatv.cookies')
 
-        self._client = simplemedia.WebClient(headers, cookie_file)
+        cookies = LWPCookieJar(cookie_file)
+        if os.path.exists(cookie_file):
+            cookies.load(ignore_discard=True, ignore_expires=True)
+
+        return cookies
+
+    @staticmethod
+    def _get_cache():
+        cache_size = addon.get_setting('cache_size')
+        if cache_size:
+            cache_file = os.path.join(addon.profile_dir, 'responses.db')
+            return ResponseCache(cache_file, cache_size * 1024 * 1024)
@@ -0,0 +1,144 @@
+# -*- coding: utf-8 -*-
+# License: GPL v.3 https://www.gnu.org/copyleft/gpl.html
+
+from __future__ import unicode_literals
+
+import threading
+
+from future.utils import iteritems
+
+__all__ = ['PageSizer', 'ThroughputMeter']
+
+
+class PageSizer(object):
+    """
+    Chooses page sizes from the observed latency of API calls
+
+    The latency of a call is modeled as a fixed overhead plus a cost per item,
+    both are fitted by least squares over the recent calls of an endpoint.
+    """
+    max_samples = 20
+    min_samples = 3
+
+    def __init__(self, samples=None):
+        self._lock = threading.Lock()
+        self._samples = {}
+
+        for endpoint, items in iteritems(samples or {}):
+            self._samples[endpoint] = list(items)[-self.max_samples:]
+
+    @property
+    def samples(self):
+        with self._lock:
+            return dict((endpoint, list(items)) for endpoint, items in iteritems(self._samples))
+
+    def add_sample(self, endpoint, items, seconds):
+        if items <= 0:
+            return
+
+        with self._lock:
+            samples = self._samples.setdefault(endpoint, [])
+            samples.append((items, seconds))
+            del samples[:-self.max_samples]
+
+    def estimate(self, endpoint):
+        """
+        Returns a tuple of the overhead and the cost per item in seconds or None
+        """
+        with self._lock:
+            samples = list(self._samples.get(endpoint, []))
+
+        if len(samples) < self.min_samples:
+            return None
+
+        count = float(len(samples))
+        mean_items = sum([items for items, seconds in samples]) / count
+        mean_seconds = sum([seconds for items, seconds in samples]) / count
+
+        variance = sum([(items - mean_items) ** 2 for items, seconds in samples])
+        if variance:
+            covariance = sum([(items - mean_items) * (seconds - mean_seconds) for items, seconds in samples])
+            per_item = max(covariance / variance, 0.0)
+            overhead = max(mean_seconds - per_item * mean_items, 0.0)
+        else:
+            # Pages of the same size, the overhead can not be separated
+            per_item = mean_seconds / mean_items
+            overhead = 0.0
+
+        return overhead, per_item
+
+    def page_size(self, endpoint, target, minimum, maximum, step, default):
+        """
+        Returns the largest page size, that is expected to load within target seconds
+        """
+        estimate = self.estimate(endpoint)
+        if estimate is None:
+            return default
+
+        overhead, per_item = estimate
+        if not per_item:
+            return maximum
+
+        size = int((target - overhead) / per_item)
+        size -= size % step
+
+        return min(max(size, minimum), maximum)
+
+
+class ThroughputMeter(object):
+    """
+    Estimates the download throughput from the sizes and durations of stream downloads
+
+    Short downloads are dominated by TCP slow start, so only downloads of at
+    least min_bytes are taken into account.
+    """
+    max_samples = 20
+    min_samples = 3
+    min_bytes = 32 * 1024
+
+    def __init__(self, samples=None):
+        self._lock = threading.Lock()
+        self._samples = list(samples or [])[-self.max_samples:]
+
+    @property
+    def samples(self):
+        with self._lock:
+            return list(self._samples)
+
+    def add_sample(self, size, seconds):
+        if size < self.min_bytes \
+                or seconds <= 0:
+            return
+
+        with self._lock:
+            self._samples.append((size, seconds))
+            del self._samples[:-self.max_samples]
+
+    def throughput(self):
+        """
+        Returns the throughput in bytes per second or None
+        """
+        with self._lock:
+            samples = list(self._samples)
+
+        if len(samples) < self.min_samples:
+            return None
+
+        return sum([size for size, seconds in samples]) / sum([seconds for size, seconds in samples])
+
+    def quality(self, bitrates, headroom, default):
+        """
+        Returns the index of the highest bitrate in kbit/s, that the throughput sustains with the headroom
+        """
+        throughput = self.throughput()
+        if throughput is None:
+            return default
+
+        kbits = throughput * 8 / 1000.0
+
+        quality = 0
+        for index, bitrate in enumerate(bitrates):
+            if bitrate * headroom <= kbits:
+                quality = index
+
+        return quality
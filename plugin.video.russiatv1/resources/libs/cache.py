@@ -0,0 +1,124 @@
+# -*- coding: utf-8 -*-
+# License: GPL v.3 https://www.gnu.org/copyleft/gpl.html
+
+from __future__ import unicode_literals
+
+import hashlib
+import sqlite3
+import threading
+import time
+
+from future.utils import iteritems
+
+__all__ = ['ResponseCache']
+
+
+class ResponseCache(object):
+    """
+    Persistent cache of API responses with LRU eviction
+
+    Entries are stored in a SQLite database, so the cache survives between
+    plugin invocations and can be shared with other processes of the add-on.
+    """
+    _schema_version = 3
+
+    def __init__(self, path, max_size):
+        self._max_size = max_size
+        self._lock = threading.Lock()
+
+        self._db = sqlite3.connect(path, timeout=10, check_same_thread=False)
+        self._init_schema()
+
+    def __del__(self):
+        self.close()
+
+    def _init_schema(self):
+        with self._lock, self._db:
+            version = self._db.execute('PRAGMA user_version').fetchone()[0]
+            if version != self._schema_version:
+                self._db.execute('DROP TABLE IF EXISTS responses')
+                self._db.execute('PRAGMA user_version = {0}'.format(self._schema_version))
+
+            self._db.execute('CREATE TABLE IF NOT EXISTS responses ('
+                             'key TEXT PRIMARY KEY, '
+                             'body BLOB NOT NULL, '
+                             'size INTEGER NOT NULL, '
+                             'expires REAL NOT NULL, '
+                             'accessed REAL NOT NULL, '
+                             'etag TEXT, '
+                             'last_modified TEXT)')
+            self._db.execute('CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed)')
+
+    @staticmethod
+    def make_key(url, params=None):
+        parts = [url]
+        if params:
+            for name, value in sorted(iteritems(params)):
+                if value is not None:
+                    parts.append('{0}={1}'.format(name, value))
+
+        return hashlib.sha1('&'.join(parts).encode('utf-8')).hexdigest()
+
+    def get(self, key, max_stale=0):
+        """
+        Returns an entry dict with body, expiration time and validators or None
+
+        Entries expired less than ``max_stale`` seconds ago are returned too.
+        """
+        now = time.time()
+        with self._lock, self._db:
+            row = self._db.execute('SELECT body, expires, etag, last_modified FROM responses WHERE key = ?',
+                                   (key,)).fetchone()
+            if row is None \
+                    or row[1] + max_stale < now:
+                return None
+
+            self._db.execute('UPDATE responses SET accessed = ? WHERE key = ?', (now, key))
+
+        return {'body': bytes(row[0]),
+                'expires': row[1],
+                'etag': row[2],
+                'last_modified': row[3],
+                }
+
+    def set(self, key, body, ttl, etag=None, last_modified=None):
+        if self._max_size <= 0 \
+                or len(body) > self._max_size:
+            return
+
+        now = time.time()
+        with self._lock, self._db:
+            self._db.execute('INSERT OR REPLACE INTO responses '
+                             '(key, body, size, expires, accessed, etag, last_modified) '
+                             'VALUES (?, ?, ?, ?, ?, ?, ?)',
+                             (key, sqlite3.Binary(body), len(body), now + ttl, now, etag, last_modified))
+            self._evict()
+
+    def refresh(self, key, ttl):
+        """
+        Extends the lifetime of an entry confirmed by the server as not modified
+        """
+        now = time.time()
+        with self._lock, self._db:
+            self._db.execute('UPDATE responses SET expires = ?, accessed = ? WHERE key = ?', (now + ttl, now, key))
+
+    def close(self):
+        db = getattr(self, '_db', None)
+        if db is not None:
+            db.close()
+            self._db = None
+
+    def _evict(self):
+        total_size = self._db.execute('SELECT COALESCE(SUM(size), 0) FROM responses').fetchone()[0]
+        if total_size <= self._max_size:
+            return
+
+        rows = self._db.execute('SELECT key, size FROM responses ORDER BY accessed').fetchall()
+        keys = []
+        for key, size in rows:
+            if total_size <= self._max_size:
+                break
+            keys.append((key,))
+            total_size -= size
+
+        self._db.executemany('DELETE FROM responses WHERE key = ?', keys)
@@ -0,0 +1,233 @@
+# -*- coding: utf-8 -*-
+# License: GPL v.3 https://www.gnu.org/copyleft/gpl.html
+
+from __future__ import unicode_literals
+
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+
+import simplemedia
+from future.utils import iteritems
+
+from .listitems import BrandInfo
+
+__all__ = ['Catalogue', 'get_catalogue', 'update_catalogue']
+
+addon = simplemedia.Addon()
+
+_token_re = re.compile(r'\w+', re.UNICODE)
+
+
+class Catalogue(object):
+    """
+    Local index of channel brands for offline search
+
+    Brands are added page by page during an update pass. Every brand is indexed
+    by normalized word tokens, a search query matches brands that have a token
+    starting with each word of the query.
+    """
+    _schema_version = 1
+
+    # Token weights of indexed fields
+    title_weight = 3
+    tag_weight = 2
+    people_weight = 1
+
+    # Interval between complete update passes
+    update_interval = 24 * 60 * 60
+
+    def __init__(self, path):
+        self._lock = threading.Lock()
+
+        self._db = sqlite3.connect(path, timeout=10, check_same_thread=False)
+        self._init_schema()
+
+    def __del__(self):
+        self.close()
+
+    def _init_schema(self):
+        with self._lock, self._db:
+            version = self._db.execute('PRAGMA user_version').fetchone()[0]
+            if version != self._schema_version:
+                self._db.execute('DROP TABLE IF EXISTS brands')
+                self._db.execute('DROP TABLE IF EXISTS tokens')
+                self._db.execute('DROP TABLE IF EXISTS meta')
+                self._db.execute('PRAGMA user_version = {0}'.format(self._schema_version))
+
+            self._db.execute('CREATE TABLE IF NOT EXISTS brands ('
+                             'id INTEGER PRIMARY KEY, '
+                             'title TEXT NOT NULL, '
+                             'data TEXT NOT NULL, '
+                             'generation INTEGER NOT NULL)')
+            self._db.execute('CREATE TABLE IF NOT EXISTS tokens ('
+                             'token TEXT NOT NULL, '
+                             'brand_id INTEGER NOT NULL, '
+                             'weight INTEGER NOT NULL)')
+            self._db.execute('CREATE INDEX IF NOT EXISTS tokens_token ON tokens (token)')
+            self._db.execute('CREATE INDEX IF NOT EXISTS tokens_brand_id ON tokens (brand_id)')
+            self._db.execute('CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value REAL NOT NULL)')
+
+    @staticmethod
+    def normalize(text):
+        return text.lower().replace('ё', 'е')
+
+    @classmethod
+    def tokenize(cls, text):
+        if not text:
+            return []
+        return _token_re.findall(cls.normalize('{0}'.format(text)))
+
+    @property
+    def updated(self):
+        """
+        Time of the last complete update pass, 0 if the index was never built
+        """
+        return self._get_meta('updated', 0)
+
+    @property
+    def outdated(self):
+        return self.updated + self.update_interval < time.time()
+
+    @property
+    def offset(self):
+        """
+        Page number of the next page of the current update pass
+        """
+        return int(self._get_meta('offset', 0))
+
+    def add_brands(self, brands, next_offset):
+        """
+        Adds a page of brands to the index
+
+        :param brands: list of tuples of a brand dict and a dict of indexed terms
+            {weight: [text, ...]}
+        :param next_offset: page number of the next page of the update pass
+        """
+        generation = int(self._get_meta('generation', 0))
+
+        with self._lock, self._db:
+            for brand_info, terms in brands:
+                brand_id = brand_info['id']
+                self._db.execute('DELETE FROM tokens WHERE brand_id = ?', (brand_id,))
+                self._db.execute('INSERT OR REPLACE INTO brands (id, title, data, generation) VALUES (?, ?, ?, ?)',
+                                 (brand_id, self.normalize(brand_info['title']), json.dumps(brand_info), generation))
+
+                weights = {}
+                for weight, texts in iteritems(terms):
+                    for text in texts:
+                        for token in self.tokenize(text):
+                            weights[token] = max(weights.get(token, 0), weight)
+
+                self._db.executemany('INSERT INTO tokens (token, brand_id, weight) VALUES (?, ?, ?)',
+                                     [(token, brand_id, weight) for token, weight in iteritems(weights)])
+
+            self._set_meta('offset', next_offset)
+
+    def finish_update(self):
+        """
+        Completes the update pass and removes brands, that were not seen during it
+        """
+        generation = int(self._get_meta('generation', 0))
+
+        with self._lock, self._db:
+            self._db.execute('DELETE FROM tokens WHERE brand_id IN (SELECT id FROM brands WHERE generation != ?)',
+                             (generation,))
+            self._db.execute('DELETE FROM brands WHERE generation != ?', (generation,))
+
+            self._set_meta('generation', generation + 1)
+            self._set_meta('offset', 0)
+            self._set_meta('updated', time.time())
+
+    def search(self, keyword, limit, offset):
+        """
+        Returns matching brands in the format of the /brands/ API method
+        """
+        scores = None
+        for word in set(self.tokenize(keyword)):
+            with self._lock:
+                rows = self._db.execute('SELECT brand_id, MAX(weight) FROM tokens '
+                                        'WHERE token >= ? AND token < ? GROUP BY brand_id',
+                                        (word, word + '\uffff')).fetchall()
+            matches = dict(rows)
+
+            if scores is None:
+                scores = matches
+            else:
+                scores = dict((brand_id, score + matches[brand_id])
+                              for brand_id, score in iteritems(scores) if brand_id in matches)
+
+            if not scores:
+                break
+
+        ranked = sorted(iteritems(scores or {}), key=lambda item: (-item[1], item[0]))
+        brand_ids = [brand_id for brand_id, score in ranked]
+        page_ids = brand_ids[offset * limit:(offset + 1) * limit]
+
+        data = []
+        if page_ids:
+            with self._lock:
+                rows = self._db.execute('SELECT id, data FROM brands WHERE id IN ({0})'.format(
+                    ', '.join(['?'] * len(page_ids))), page_ids).fetchall()
+            brands = dict((brand_id, json.loads(brand_data)) for brand_id, brand_data in rows)
+            data = [brands[brand_id] for brand_id in page_ids if brand_id in brands]
+
+        return {'data': data,
+                'pagination': {'totalCount': len(brand_ids),
+                               'limit': limit,
+                               'offset': offset,
+                               },
+                }
+
+    def close(self):
+        db = getattr(self, '_db', None)
+        if db is not None:
+            db.close()
+            self._db = None
+
+    def _get_meta(self, name, default):
+        with self._lock:
+            row = self._db.execute('SELECT value FROM meta WHERE name = ?', (name,)).fetchone()
+        return row[0] if row is not None else default
+
+    def _set_meta(self, name, value):
+        self._db.execute('INSERT OR REPLACE INTO meta (name, value) VALUES (?, ?)', (name, value))
+
+
+def get_catalogue():
+    catalogue_file = os.path.join(addon.profile_dir, 'catalogue.db')
+    return Catalogue(catalogue_file)
+
+
+def update_catalogue(api, catalogue, max_pages=0, limit=100):
+    """
+    Continues the update pass of the local catalogue
+
+    Returns True when the pass is completed.
+    """
+    pages = 0
+    while not max_pages \
+            or pages < max_pages:
+        offset = catalogue.offset
+        result = api.brands([], limit, offset)
+
+        brands = []
+        for brand_info in result['data']:
+            item_info = BrandInfo(brand_info)
+            people = (item_info.cast or []) + (item_info.director or []) + (item_info.writer or [])
+            terms = {Catalogue.title_weight: [brand_info['title'], brand_info['titleOrig']],
+                     Catalogue.tag_weight: (item_info.tag or []) + [brand_info['productionYearStart']],
+                     Catalogue.people_weight: people,
+                     }
+            brands.append((brand_info, terms))
+        catalogue.add_brands(brands, offset + 1)
+        pages += 1
+
+        if (offset + 1) * limit >= result['pagination']['totalCount']:
+            catalogue.finish_update()
+            return True
+
+    return False
@@ -0,0 +1,135 @@
+# -*- coding: utf-8 -*-
+# License: GPL v.3 https://www.gnu.org/copyleft/gpl.html
+
+from __future__ import unicode_literals
+
+import os
+import sqlite3
+import threading
+
+import simplemedia
+
+__all__ = ['EpisodeIndex', 'get_episode_index', 'update_episode_index']
+
+addon = simplemedia.Addon()
+
+# Page size of the episode index scan, only ids and numbers are requested
+_episode_scan_limit = 1000
+_episode_scan_includes = ['id', 'series', 'dateRec']
+
+
+class EpisodeIndex(object):
+    """
+    Local index of brand episodes in the order of season pages
+
+    Every episode is stored with its position in the brand, so the season page
+    of an episode and the episode numbers of a page are known without paging
+    through the API.
+    """
+    _schema_version = 1
+
+    def __init__(self, path):
+        self._lock = threading.Lock()
+
+        self._db = sqlite3.connect(path, timeout=10, check_same_thread=False)
+        self._init_schema()
+
+    def __del__(self):
+        self.close()
+
+    def _init_schema(self):
+        with self._lock, self._db:
+            version = self._db.execute('PRAGMA user_version').fetchone()[0]
+            if version != self._schema_version:
+                self._db.execute('DROP TABLE IF EXISTS episodes')
+                self._db.execute('PRAGMA user_version = {0}'.format(self._schema_version))
+
+            self._db.execute('CREATE TABLE IF NOT EXISTS episodes ('
+                             'brand_id INTEGER NOT NULL, '
+                             'sort TEXT NOT NULL, '
+                             'position INTEGER NOT NULL, '
+                             'video_id INTEGER NOT NULL, '
+                             'series INTEGER, '
+                             'date_rec TEXT, '
+                             'PRIMARY KEY (brand_id, sort, position))')
+            self._db.execute('CREATE INDEX IF NOT EXISTS episodes_series ON episodes (brand_id, sort, series)')
+
+    def count(self, brand_id, sort):
+        """
+        Returns the number of indexed episodes of the brand
+        """
+        with self._lock:
+            row = self._db.execute('SELECT COUNT(*) FROM episodes WHERE brand_id = ? AND sort = ?',
+                                   (brand_id, sort)).fetchone()
+        return row[0]
+
+    def add_episodes(self, brand_id, sort, position, videos):
+        """
+        Replaces episodes of the brand starting from the position
+
+        :param videos: list of video dicts with id, series and dateRec fields
+        """
+        with self._lock, self._db:
+            self._db.execute('DELETE FROM episodes WHERE brand_id = ? AND sort = ? AND position >= ?',
+                             (brand_id, sort, position))
+            self._db.executemany('INSERT INTO episodes (brand_id, sort, position, video_id, series, date_rec) '
+                                 'VALUES (?, ?, ?, ?, ?, ?)',
+                                 [(brand_id, sort, position + index, video['id'], video.get('series') or None,
+                                   video.get('dateRec')) for index, video in enumerate(videos)])
+
+    def find(self, brand_id, sort, series):
+        """
+        Returns the position of the episode with the series number or None
+        """
+        with self._lock:
+            row = self._db.execute('SELECT MIN(position) FROM episodes WHERE brand_id = ? AND sort = ? AND series = ?',
+                                   (brand_id, sort, series)).fetchone()
+        return row[0]
+
+    def series_range(self, brand_id, sort, position, limit):
+        """
+        Returns a tuple of the first and the last series numbers of a page or None,
+        if some episodes of the page have no number
+        """
+        with self._lock:
+            row = self._db.execute('SELECT MIN(series), MAX(series), COUNT(series), COUNT(*) FROM episodes '
+                                   'WHERE brand_id = ? AND sort = ? AND position >= ? AND position < ?',
+                                   (brand_id, sort, position, position + limit)).fetchone()
+
+        first, last, numbered, total = row
+        if total \
+                and numbered == total:
+            return first, last
+
+    def close(self):
+        db = getattr(self, '_db', None)
+        if db is not None:
+            db.close()
+            self._db = None
+
+
+def get_episode_index():
+    index_file = os.path.join(addon.profile_dir, 'episodes.db')
+    return EpisodeIndex(index_file)
+
+
+def update_episode_index(api, episode_index, brand_id, sort, total):
+    """
+    Brings the episode index of a brand up to date with the total count of its episodes
+
+    New episodes are added to the end of the brand, so only the pages past the
+    indexed episodes are requested. The brand is scanned again, if episodes were removed.
+    """
+    indexed = episode_index.count(brand_id, sort)
+    if indexed == total:
+        return
+    elif indexed > total:
+        indexed = 0
+
+    offset = indexed // _episode_scan_limit
+    while offset * _episode_scan_limit < total:
+        result = api.videos(brand_id, sort, _episode_scan_limit, offset, includes=_episode_scan_includes)
+        episode_index.add_episodes(brand_id, sort, offset * _episode_scan_limit, result['data'])
+
+        total = result['pagination']['totalCount']
+        offset += 1
@@ -0,0 +1,150 @@
+# -*- coding: utf-8 -*-
+# License: GPL v.3 https://www.gnu.org/copyleft/gpl.html
+
+from __future__ import unicode_literals
+
+import sys
+import threading
+
+from future.moves.queue import Queue
+
+__all__ = ['Executor', 'Future', 'FutureTimeout']
+
+
+class FutureTimeout(Exception):
+    pass
+
+
+class Future(object):
+
+    def __init__(self):
+        self._event = threading.Event()
+        self._result = None
+        self._exc_info = None
+
+    def done(self):
+        return self._event.is_set()
+
+    def result(self, timeout=None):
+        self._event.wait(timeout)
+        if not self._event.is_set():
+            raise FutureTimeout('Request was not completed in {0} s'.format(timeout))
+
+        if self._exc_info is not None:
+            raise self._exc_info[1]
+
+        return self._result
+
+    def exception(self, timeout=None):
+        self._event.wait(timeout)
+        if not self._event.is_set():
+            raise FutureTimeout('Request was not completed in {0} s'.format(timeout))
+
+        if self._exc_info is not None:
+            return self._exc_info[1]
+
+    def set_result(self, result):
+        self._result = result
+        self._event.set()
+
+    def set_exception(self, exc_info):
+        self._exc_info = exc_info
+        self._event.set()
+
+    def run(self, func, args, kwargs):
+        try:
+            result = func(*args, **kwargs)
+        except Exception:
+            self.set_exception(sys.exc_info())
+        else:
+            self.set_result(result)
+
+
+class Executor(object):
+    """
+    Bounded pool of daemon threads
+
+    Threads are started on demand up to ``max_workers``. With ``max_workers``
+    less than 2 calls are executed immediately in the calling thread, except
+    for the calls of ``submit_async``.
+    """
+
+    def __init__(self, max_workers):
+        self._max_workers = max_workers
+        self._tasks = Queue()
+        self._threads = []
+        self._idle = 0
+        self._lock = threading.Lock()
+        self._shutdown = False
+
+    @property
+    def max_workers(self):
+        return self._max_workers
+
+    def submit(self, func, *args, **kwargs):
+        future = Future()
+
+        if self._max_workers < 2 \
+                or self._shutdown:
+            future.run(func, args, kwargs)
+        else:
+            self._tasks.put((future, func, args, kwargs))
+            self._adjust_threads()
+
+        return future
+
+    def submit_async(self, func, *args, **kwargs):
+        """
+        Submits a call, that never runs in the calling thread
+
+        Without pool threads the call gets a thread of its own.
+        """
+        if self._max_workers >= 2 \
+                and not self._shutdown:
+            return self.submit(func, *args, **kwargs)
+
+        future = Future()
+
+        thread = threading.Thread(target=future.run, args=(func, args, kwargs))
+        thread.daemon = True
+        thread.start()
+
+        return future
+
+    def shutdown(self, wait=False):
+        with self._lock:
+            self._shutdown = True
+            threads = list(self._threads)
+
+        for _ in threads:
+            self._tasks.put(None)
+
+        if wait:
+            for thread in threads:
+                thread.join()
+
+    def _adjust_threads(self):
+        with self._lock:
+            if self._tasks.qsize() <= self._idle \
+                    or len(self._threads) >= self._max_workers:
+                return
+
+            thread = threading.Thread(target=self._worker)
+            thread.daemon = True
+            self._threads.append(thread)
+
+        thread.start()
+
+    def _worker(self):
+        while True:
+            with self._lock:
+                self._idle += 1
+            task = self._tasks.get()
+            with self._lock:
+                self._idle -= 1
+
+            if task is None:
+                break
+
+            future, func, args, kwargs = task
+            future.run(func, args, kwargs)
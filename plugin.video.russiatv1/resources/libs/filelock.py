@@ -0,0 +1,55 @@
+# -*- coding: utf-8 -*-
+# License: GPL v.3 https://www.gnu.org/copyleft/gpl.html
+
+from __future__ import unicode_literals
+
+import errno
+import os
+import time
+
+__all__ = ['FileLock']
+
+
+class FileLock(object):
+    """
+    Lock shared by all threads and invocations of the add-on
+
+    The lock is held as an exclusively created file. Plugin invocations run in
+    separate interpreters, so a threading lock does not serialize them. A lock
+    file older than ``stale`` seconds is left by a crashed invocation and is
+    taken over.
+    """
+    _poll_interval = 0.05
+
+    def __init__(self, path, stale=60):
+        self._path = path
+        self._stale = stale
+
+    def __enter__(self):
+        while True:
+            try:
+                os.close(os.open(self._path, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+                return self
+            except OSError as e:
+                if e.errno != errno.EEXIST:
+                    raise
+
+            if self._is_stale():
+                self._remove()
+            else:
+                time.sleep(self._poll_interval)
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self._remove()
+
+    def _is_stale(self):
+        try:
+            return os.path.getmtime(self._path) + self._stale < time.time()
+        except OSError:
+            return False
+
+    def _remove(self):
+        try:
+            os.remove(self._path)
+        except OSError:
+            pass
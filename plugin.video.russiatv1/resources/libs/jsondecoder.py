@@ -0,0 +1,51 @@
+# -*- coding: utf-8 -*-
+# License: GPL v.3 https://www.gnu.org/copyleft/gpl.html
+
+from __future__ import unicode_literals
+
+import json
+from collections import OrderedDict
+
+__all__ = ['decoders', 'get_decoder']
+
+
+def _load_decoders():
+    """
+    Returns available decoders from the fastest one, every decoder accepts raw UTF-8 bytes
+    and raises ValueError on malformed documents
+    """
+    result = OrderedDict()
+
+    try:
+        import orjson
+    except ImportError:
+        pass
+    else:
+        result['orjson'] = orjson.loads
+
+    try:
+        import ujson
+    except ImportError:
+        pass
+    else:
+        result['ujson'] = ujson.loads
+
+    # Detects the encoding of bytes on python 3, decodes str as UTF-8 on python 2
+    result['json'] = json.loads
+
+    return result
+
+
+decoders = _load_decoders()
+
+
+def get_decoder(name=None):
+    """
+    Returns a tuple of the name and the loads function of a decoder
+
+    The named decoder is returned if it is available, the fastest one otherwise.
+    """
+    if name not in decoders:
+        name = next(iter(decoders))
+
+    return name, decoders[name]
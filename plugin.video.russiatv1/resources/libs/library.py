@@ -0,0 +1,329 @@
+# -*- coding: utf-8 -*-
+# License: GPL v.3 https://www.gnu.org/copyleft/gpl.html
+
+from __future__ import unicode_literals
+
+import hashlib
+import io
+import json
+import os
+import re
+import xml.etree.ElementTree as ElementTree
+
+import simplemedia
+import xbmcvfs
+from future.utils import iteritems
+
+from .filelock import FileLock
+from .listitems import BrandInfo, VideoInfo
+from .records import BrandRecord
+from .russiatv1 import RussiaTvError
+
+__all__ = ['LibraryExporter', 'get_library_exporter', 'get_library_brand', 'get_exported_brands', 'get_all_brands',
+           'export_brands']
+
+addon = simplemedia.Addon()
+
+_unsafe_chars_re = re.compile(r'[\\/:*?"<>|]+')
+
+# Page sizes of requests of the export
+_export_brands_limit = 100
+_export_videos_limit = 1000
+
+
+class LibraryExporter(object):
+    """
+    Writes .strm and .nfo files of brands to a folder of the Kodi library
+
+    The manifest keeps digests of the written files of every brand, so a later
+    export writes only new or changed files and removes files of episodes,
+    that are gone, without scanning the library folder. Exports of different
+    invocations merge their brands into the manifest under a lock file.
+    """
+    plugin = None
+
+    movies_folder = 'Movies'
+    tvshows_folder = 'TV Shows'
+
+    # Field profile of exported brands, tvshow.nfo needs seriesIsOver of the listing one
+    brand_profile = 'listing'
+
+    def __init__(self, path, manifest_path):
+        self._path = path
+        self._manifest_path = manifest_path
+
+        self._manifest = self._load_manifest()
+        self._exported = set()
+
+    @property
+    def brands(self):
+        """
+        Returns ids of the exported brands
+        """
+        return [int(brand_id) for brand_id in self._manifest]
+
+    def export_brand(self, brand_info, videos):
+        """
+        Writes files of a brand and its full videos, returns the number of written files
+        """
+        brand_record = BrandRecord(brand_info)
+        item_info = BrandInfo(brand_record)
+
+        # File names are the library-friendly titles of the use_atl_names mode
+        files = {}
+        if item_info.mediatype == 'movie':
+            name_info = BrandInfo(brand_record, atl_names=True)
+            if videos:
+                item_info = VideoInfo(brand_record, videos[0])
+                name_info = VideoInfo(brand_record, videos[0], atl_names=True)
+
+            name = self._clean_name(name_info.title)
+            folder = '/'.join([self.movies_folder, name])
+            files['{0}/{1}.strm'.format(folder, name)] = self._get_strm(item_info)
+            files['{0}/{1}.nfo'.format(folder, name)] = self._get_movie_nfo(item_info)
+        else:
+            folder = '/'.join([self.tvshows_folder, self._clean_name(item_info.tvshowtitle)])
+            files['{0}/tvshow.nfo'.format(folder)] = self._get_tvshow_nfo(item_info)
+
+            for episode, video in enumerate(videos, 1):
+                video_info = VideoInfo(brand_record, video)
+                video_info.set_episode(episode)
+                name_info = VideoInfo(brand_record, video, atl_names=True)
+                name_info.set_episode(episode)
+
+                name = self._clean_name(name_info.title)
+                season_folder = '{0}/Season {1:02d}'.format(folder, video_info.season)
+                if '{0}/{1}.strm'.format(season_folder, name) in files:
+                    # Episodes with the same name would overwrite each other
+                    name = '{0} [{1}]'.format(name, video_info.video_id)
+                files['{0}/{1}.strm'.format(season_folder, name)] = self._get_strm(video_info)
+                files['{0}/{1}.nfo'.format(season_folder, name)] = self._get_episode_nfo(video_info)
+
+        return self._sync(brand_record.id, files)
+
+    def save(self):
+        """
+        Merges the exported brands into the manifest on disk
+        """
+        with FileLock(self._manifest_path + '.lock'):
+            manifest = self._load_manifest()
+            for brand_id in self._exported:
+                manifest[brand_id] = self._manifest[brand_id]
+
+            # Readers never see a partially written manifest
+            temp_path = self._manifest_path + '.tmp'
+            with io.open(temp_path, 'w', encoding='utf-8') as f:
+                # Python 2 dumps a byte string, if there is no text in the manifest
+                f.write('{0}'.format(json.dumps(manifest, ensure_ascii=False)))
+            self._replace(temp_path, self._manifest_path)
+
+        self._manifest = manifest
+        self._exported = set()
+
+    def _load_manifest(self):
+        if not os.path.exists(self._manifest_path):
+            return {}
+
+        with io.open(self._manifest_path, encoding='utf-8') as f:
+            return json.load(f)
+
+    @staticmethod
+    def _replace(src, dst):
+        if hasattr(os, 'replace'):
+            os.replace(src, dst)
+        else:
+            # Python 2 renames over an existing file only on POSIX
+            if os.name == 'nt' \
+                    and os.path.exists(dst):
+                os.remove(dst)
+            os.rename(src, dst)
+
+    def _sync(self, brand_id, files):
+        exported = self._manifest.get(str(brand_id), {})
+
+        digests = {}
+        written = 0
+        for file_path, content in iteritems(files):
+            digest = hashlib.sha1(content.encode('utf-8')).hexdigest()
+            digests[file_path] = digest
+            if exported.get(file_path) != digest:
+                self._write(file_path, content)
+                written += 1
+
+        for file_path in exported:
+            if file_path not in digests:
+                xbmcvfs.delete(self._get_path(file_path))
+
+        self._manifest[str(brand_id)] = digests
+        self._exported.add(str(brand_id))
+
+        return written
+
+    def _get_path(self, file_path):
+        return os.path.join(self._path, *file_path.split('/'))
+
+    def _write(self, file_path, content):
+        path = self._get_path(file_path)
+
+        folder = os.path.dirname(path)
+        if not xbmcvfs.exists(folder + os.sep):
+            xbmcvfs.mkdirs(folder)
+
+        f = xbmcvfs.File(path, 'w')
+        try:
+            f.write(bytearray(content.encode('utf-8')))
+        finally:
+            f.close()
+
+    @staticmethod
+    def _clean_name(name):
+        return _unsafe_chars_re.sub(' ', '{0}'.format(name)).strip(' .')
+
+    def _get_strm(self, item_info):
+        # Movies without item details are resolved on play, as in listings
+        if item_info.video_id:
+            return self.plugin.url_for('play_video', video_id=item_info.video_id, strm=1)
+        else:
+            return self.plugin.url_for('play_video', video_id=0, brand_id=item_info.brand_id, strm=1)
+
+    def _get_movie_nfo(self, item_info):
+        root = ElementTree.Element('movie')
+        self._add_elements(root, [('title', item_info.title),
+                                  ('originaltitle', item_info.original_title),
+                                  ('plot', item_info.plot),
+                                  ('year', item_info.year),
+                                  ('mpaa', item_info.mpaa),
+                                  ('runtime', self._get_runtime(item_info.duration)),
+                                  ])
+        self._add_lists(root, item_info)
+        return self._to_string(root)
+
+    def _get_tvshow_nfo(self, item_info):
+        root = ElementTree.Element('tvshow')
+        self._add_elements(root, [('title', item_info.tvshowtitle),
+                                  ('plot', item_info.plot),
+                                  ('year', item_info.year),
+                                  ('mpaa', item_info.mpaa),
+                                  ('status', item_info.status),
+                                  ])
+        self._add_lists(root, item_info)
+        return self._to_string(root)
+
+    def _get_episode_nfo(self, video_info):
+        root = ElementTree.Element('episodedetails')
+        self._add_elements(root, [('title', video_info.title),
+                                  ('showtitle', video_info.tvshowtitle),
+                                  ('season', video_info.season),
+                                  ('episode', video_info.episode),
+                                  ('plot', video_info.plot),
+                                  ('aired', video_info.aired),
+                                  ('runtime', self._get_runtime(video_info.duration)),
+                                  ])
+        return self._to_string(root)
+
+    def _add_lists(self, root, item_info):
+        for tag, values in [('genre', item_info.tag),
+                            ('country', item_info.country),
+                            ('director', item_info.director),
+                            ('credits', item_info.writer),
+                            ]:
+            self._add_elements(root, [(tag, value) for value in values or []])
+
+        for name in item_info.cast or []:
+            actor = ElementTree.SubElement(root, 'actor')
+            self._add_elements(actor, [('name', name)])
+
+    @staticmethod
+    def _add_elements(root, elements):
+        for tag, value in elements:
+            if value is not None \
+                    and value != '':
+                ElementTree.SubElement(root, tag).text = '{0}'.format(value)
+
+    @staticmethod
+    def _get_runtime(duration):
+        if duration:
+            return int(duration) // 60
+
+    @staticmethod
+    def _to_string(root):
+        body = ElementTree.tostring(root, encoding='utf-8').decode('utf-8')
+        return '<?xml version="1.0" encoding="UTF-8" standalone="yes" ?>\n' + body
+
+
+def get_library_exporter():
+    library_path = addon.get_setting('library_path') or os.path.join(addon.profile_dir, 'library')
+    manifest_file = os.path.join(addon.profile_dir, 'library.json')
+    return LibraryExporter(library_path, manifest_file)
+
+
+def get_library_brand(api, brand_id):
+    return api.brand_info(brand_id, LibraryExporter.brand_profile)
+
+
+def get_exported_brands(api, exporter):
+    """
+    Returns the brands exported to the library, brands that fail to load are skipped
+    """
+    futures = [(brand_id, api.submit(get_library_brand, api, brand_id)) for brand_id in exporter.brands]
+
+    brands = []
+    for brand_id, future in futures:
+        try:
+            brands.append(future.result())
+        except (RussiaTvError, simplemedia.WebClientError) as e:
+            addon.log_error('Failed to get brand {0}: {1}'.format(brand_id, e))
+
+    return brands
+
+
+def get_all_brands(api, tags):
+    """
+    Returns all brands with the tags, pages after the first one are requested concurrently
+    """
+    result = api.brands(tags, _export_brands_limit, 0)
+    brands = result['data']
+
+    pages = range(1, -(-result['pagination']['totalCount'] // _export_brands_limit))
+    for page_result in api.gather(*[(api.brands, tags, _export_brands_limit, offset) for offset in pages]):
+        brands.extend(page_result['data'])
+
+    return brands
+
+
+def export_brands(api, exporter, brands):
+    """
+    Exports brands to the library, full videos of the brands are requested concurrently
+
+    Returns the number of written files.
+    """
+    futures = [(brand_info, api.submit(_get_brand_videos, api, brand_info)) for brand_info in brands]
+
+    written = 0
+    for brand_info, future in futures:
+        try:
+            videos = future.result()
+        except (RussiaTvError, simplemedia.WebClientError) as e:
+            addon.log_error('Failed to export brand {0}: {1}'.format(brand_info['id'], e))
+            continue
+
+        written += exporter.export_brand(brand_info, videos)
+
+    exporter.save()
+
+    return written
+
+
+def _get_brand_videos(api, brand_info):
+    # Pages are requested one by one, brands are requested concurrently by the caller
+    videos = []
+    offset = 0
+    while True:
+        result = api.videos(brand_info['id'], brand_info['sortBy'], _export_videos_limit, offset)
+        videos.extend(result['data'])
+
+        offset += 1
+        if offset * _export_videos_limit >= result['pagination']['totalCount']:
+            break
+
+    return videos
@@ -3,14 +3,29 @@
 
 from __future__ import unicode_literals
 
+import re
+
 import simplemedia
 from future.utils import iteritems
 
+from .records import BrandRecord, VideoRecord
+
 __all__ = ['BrandInfo', 'SeasonInfo', 'VideoInfo', 'EmptyListItem', 'ListItem']
 
 addon = simplemedia.Addon()
 _ = addon.initialize_gettext()
 
+_peoples_prefixes = {
+    'cast': ['В ролях: ', 'В главной роли: ', 'В главных ролях:', 'Текст читает: ', 'Ведущие: ', 'Ведущий: ',
+             'Ведущая: '],
+    'director': ['Режиссер: ', 'Режиссеры: ', 'Режиссер-постановщик: '],
+    'writer': ['Авторы сценария: ', 'Автор сценария: ', 'Сценарий: '],
+    'other': ['Композитор: ', 'Оператор: '],
+}
+_peoples_props = dict((prefix, prop) for prop, prefixes in iteritems(_peoples_prefixes) for prefix in prefixes)
+_peoples_re = re.compile('|'.join([re.escape(prefix) for prefix in sorted(_peoples_props, key=len, reverse=True)]))
+_peoples_split_re = re.compile(', | и ')
+
 
 class BrandInfo(simplemedia.VideoInfo):
     _path = None
@@ -20,38 +35,60 @@ class BrandInfo(simplemedia.VideoInfo):
     brand_id = 0  # type: int
     video_id = 0  # type: int
 
+    # image_policy: 0 - full size, 1 - reduced, 2 - minimal
+    image_policy = 0
+    # Presets of artwork by image policy, the first available one is used
+    _art_presets = [{'banner': ['prm'], 'poster': ['bp'], 'fanart': ['hdr'], 'thumb': ['lw']},
+                    {'banner': ['prm'], 'poster': ['bp'], 'fanart': ['lw', 'hdr'], 'thumb': ['lw']},
+                    {'banner': [], 'poster': ['bp'], 'fanart': [], 'thumb': ['lw']},
+                    ]
+
+    # Parsed brand descriptions shared by all items of the brand: {brand_id: (body, parsed_body)}
+    _parsed_bodies = {}
+    _parsed_bodies_limit = 500
+
     def __init__(self, brand_info, for_play=False, atl_names=False):
+        # Items of the same brand may share a record
+        if not isinstance(brand_info, BrandRecord):
+            brand_info = BrandRecord(brand_info)
         self._brand_info = brand_info
 
         self._for_play = for_play
         self._atl_names = atl_names and not for_play
 
-        self.brand_id = brand_info['id']
+        self.brand_id = brand_info.id
 
-        self._body = self._parse_body()
+    @property
+    def _body(self):
+        body = self._brand_info.body
+
+        parsed_body = self._parsed_bodies.get(self.brand_id)
+        if parsed_body is None \
+                or parsed_body[0] != body:
+            if len(self._parsed_bodies) >= self._parsed_bodies_limit:
+                self._parsed_bodies.clear()
+            parsed_body = (body, self._parse_body())
+            self._parsed_bodies[self.brand_id] = parsed_body
+
+        return parsed_body[1]
 
     @property
     def date(self):
-        date_rec = self._brand_info['dateRec']
-        return '.'.join([date_rec[0:2], date_rec[3:5], date_rec[6:10]])
+        day, month, year = self._brand_info.date_rec[0:3]
+        return '.'.join([day, month, year])
 
     @property
     def country(self):
-        countries = self._brand_info.get('countries')
-        if countries is not None:
-            return [country['title'] for country in countries]
+        return self._brand_info.countries
 
     @property
     def year(self):
-        release_year = self._brand_info.get('productionYearStart')
-        if release_year is not None \
-                and release_year:
-            return int(release_year)
+        return self._brand_info.year
 
     @property
     def episode(self):
         if self.mediatype in ['tvshow']:
-            return self._brand_info['countFullVideos']
+            return self._brand_info.count_full_videos
 
     @property
     def season(self):
@@ -61,7 +98,7 @@ def season(self):
     @property
     def rating(self):
         if self.mediatype in ['tvshow', 'movie']:
-            return self._brand_info['rank']
+            return self._brand_info.rank
 
     @property
     def cast(self):
@@ -75,7 +112,7 @@ def director(self):
 
     @property
     def mpaa(self):
-        age_restrictions = self._brand_info.get('ageRestrictions')
+        age_restrictions = self._brand_info.age_restrictions
         if age_restrictions is not None \
                 and isinstance(age_restrictions, int):
             return '{0}+'.format(age_restrictions)
@@ -86,7 +123,7 @@ def plot(self):
 
     @property
     def plotoutline(self):
-        description = self._brand_info['anons']
+        description = self._brand_info.anons
         description = addon.remove_html(description)
 
         return description
@@ -101,8 +138,8 @@ def title(self):
 
     @property
     def original_title(self):
-        if self._brand_info['titleOrig']:
-            title = self._brand_info['titleOrig']
+        if self._brand_info.title_orig:
+            title = self._brand_info.title_orig
         else:
             title = self._title()
 
@@ -111,7 +148,7 @@ def original_title(self):
     @property
     def duration(self):
         if self._video_info is not None:
-            return self._video_info['duration']
+            return self._video_info.duration
 
     @property
     def writer(self):
@@ -121,23 +158,21 @@ def writer(self):
     @property
     def tvshowtitle(self):
         if self.mediatype in ['tvshow', 'season', 'episode']:
-            if self._brand_info['title']:
-                return self._brand_info['title']
+            if self._brand_info.title:
+                return self._brand_info.title
 
     @property
     def status(self):
         if self.mediatype == 'tvshow' \
-                and (self._brand_info['hasManySeries'] == 'true'):
-            if self._brand_info['seriesIsOver'] == 'true':
+                and self._brand_info.has_many_series:
+            if self._brand_info.series_is_over:
                 return _('Ended')
             else:
                 return _('Continuing')
 
     @property
     def tag(self):
-        tags = self._brand_info.get('tags')
-        if tags is not None:
-            return [tag['title'] for tag in tags]
+        return self._brand_info.tags
 
     @property
     def path(self):
@@ -151,8 +186,8 @@ def trailer(self):
     def mediatype(self):
         _mediatype = self._mediatype
         if _mediatype is None:
-            video_count = self._brand_info['countFullVideos']
-            has_series = (self._brand_info['hasManySeries'] == 'true')
+            video_count = self._brand_info.count_full_videos
+            has_series = self._brand_info.has_many_series
             if video_count > 1 \
                     or has_series:
                 _mediatype = 'tvshow'
@@ -176,7 +211,7 @@ def _get_clear_title(title):
         return title
 
     def _title(self):
-        return self._get_clear_title(self._brand_info['title'])
+        return self._get_clear_title(self._brand_info.title)
 
     def _atl_title(self):
 
@@ -189,7 +224,7 @@ def _atl_title(self):
         elif self.mediatype == 'episode':
             title_parts.append(self.tvshowtitle)
             title_parts.append('s%02de%02d' % (self.season, self.episode))
-            episode_title = '{0}'.format(self._video_info['episodeTitle'])
+            episode_title = '{0}'.format(self._video_info.episode_title)
             if episode_title:
                 title_parts.append(episode_title)
         else:
@@ -197,18 +232,12 @@ def _atl_title(self):
 
         return '.'.join(title_parts)
 
-    @staticmethod
-    def _get_image(preset, picture_item):
-        for picture in picture_item['sizes']:
-            if picture['preset'] == preset:
-                return picture['url']
-
     def _parse_body(self):
 
         plot = []
         result = {}
 
-        _text = self._brand_info['body']
+        _text = self._brand_info.body
         removed_strings = ['\t']
         for string in removed_strings:
             _text = _text.replace(string, '')
@@ -243,41 +272,33 @@ def _parse_body(self):
 
     @staticmethod
     def _get_peoples(string):
-        peoples = {
-            'cast': ['В ролях: ', 'В главной роли: ', 'В главных ролях:', 'Текст читает: ', 'Ведущие: ', 'Ведущий: ',
-                     'Ведущая: '],
-            'director': ['Режиссер: ', 'Режиссеры: ', 'Режиссер-постановщик: '],
-            'writer': ['Авторы сценария: ', 'Автор сценария: ', 'Сценарий: '],
-            'other': ['Композитор: ', 'Оператор: '],
-        }
-
-        for prop, substrings in iteritems(peoples):
-            for substring in substrings:
-                if string.startswith(substring):
-                    peoples = string[len(substring):].split(', ')
-                    items = []
-                    for people in peoples:
-                        parts = people.split(' и ')
-                        for part in parts:
-                            items.append(part)
-                    return {prop: items}
+        match = _peoples_re.match(string)
+        if match is not None:
+            prop = _peoples_props[match.group(0)]
+            return {prop: _peoples_split_re.split(string[match.end():])}
         return None
 
+    def _get_art(self, art_type, images):
+        for preset in self._art_presets[self.image_policy][art_type]:
+            url = images.get(preset)
+            if url is not None:
+                return url
+
     def get_banner(self):
-        if len(self._brand_info['pictures']):
-            return self._get_image('prm', self._brand_info['pictures'][0])
+        if len(self._brand_info.images):
+            return self._get_art('banner', self._brand_info.images[0])
 
     def get_poster(self):
-        if len(self._brand_info['pictures']):
-            return self._get_image('bp', self._brand_info['pictures'][0])
+        if len(self._brand_info.images):
+            return self._get_art('poster', self._brand_info.images[0])
 
     def get_thumb(self):
-        if len(self._brand_info['pictures']) > 1:
-            picture_item = self._brand_info['pictures'][1]
+        if len(self._brand_info.images) > 1:
+            images = self._brand_info.images[1]
         else:
-            picture_item = self._brand_info['pictures'][0]
+            images = self._brand_info.images[0]
 
-        return self._get_image('hdr', picture_item)
+        return self._get_art('fanart', images)
 
     def get_fanart(self):
         return self.get_thumb()
@@ -289,8 +310,10 @@ def set_trailer(self, trailer):
         self._trailer = trailer
 
     def set_video_info(self, video_info):
+        if not isinstance(video_info, VideoRecord):
+            video_info = VideoRecord(video_info)
         self._video_info = video_info
-        self.video_id = video_info['id']
+        self.video_id = video_info.id
 
     @property
     def brand_info(self):
@@ -303,6 +326,7 @@ def for_play(self):
 
 class SeasonInfo(BrandInfo):
     offset = 0
+    _series_range = None
 
     def __init__(self, brand_info, limit, total_episodes):
         super(SeasonInfo, self).__init__(brand_info, False, False)
@@ -319,11 +343,16 @@ def episode(self):
 
     @property
     def title(self):
-        last_episode = min((self.offset * self.limit) + self.limit, self.total_episodes)
-        return '{0} {1}-{2}'.format(_('Episodes'), (self.offset * self.limit) + 1, last_episode)
+        if self._series_range is not None:
+            first_episode, last_episode = self._series_range
+        else:
+            first_episode = (self.offset * self.limit) + 1
+            last_episode = min((self.offset * self.limit) + self.limit, self.total_episodes)
+        return '{0} {1}-{2}'.format(_('Episodes'), first_episode, last_episode)
 
-    def set_offset(self, offset):
+    def set_offset(self, offset, series_range=None):
         self.offset = offset
+        self._series_range = series_range
 
 
 class VideoInfo(BrandInfo):
@@ -332,19 +361,18 @@ class VideoInfo(BrandInfo):
     def __init__(self, brand_info, video_info, for_play=False, atl_names=False):
         super(VideoInfo, self).__init__(brand_info, for_play, atl_names)
 
-        self._video_info = video_info
-        self.video_id = video_info['id']
+        self.set_video_info(video_info)
 
     @property
     def date(self):
-        date_rec = self._video_info['dateRec']
-        return '{0}.{1}.{2}'.format(date_rec[0:2], date_rec[3:5], date_rec[6:10])
+        day, month, year = self._video_info.date_rec[0:3]
+        return '{0}.{1}.{2}'.format(day, month, year)
 
     @property
     def episode(self):
         if self.mediatype == 'episode':
-            if self._video_info['series']:
-                episode = self._video_info['series']
+            if self._video_info.series:
+                episode = self._video_info.series
             else:
                 episode = self._episode
             return episode
@@ -354,7 +382,7 @@ def season(self):
         if self.mediatype == 'episode' \
                 and self.episode is not None:
 
-            parts = self._brand_info['title'].split('-')
+            parts = self._brand_info.title.split('-')
             if parts[-1].isdigit():
                 season = int(parts[-1])
             else:
@@ -364,14 +392,14 @@ def season(self):
     @property
     def plot(self):
         if self.mediatype == 'episode':
-            return self._video_info['anons']
+            return self._video_info.anons
         else:
             return super(VideoInfo, self).plot
 
     @property
     def plotoutline(self):
         if self.mediatype == 'episode':
-            return self._video_info['anons']
+            return self._video_info.anons
         else:
             return super(VideoInfo, self).plotoutline
 
@@ -384,24 +412,24 @@ def originaltitle(self):
 
     @property
     def duration(self):
-        return self._video_info['duration']
+        return self._video_info.duration
 
     @property
     def aired(self):
-        date_rec = self._video_info['dateRec']
-        return '{0}-{1}-{2}'.format(date_rec[6:10], date_rec[3:5], date_rec[0:2])
+        day, month, year = self._video_info.date_rec[0:3]
+        return '{0}-{1}-{2}'.format(year, month, day)
 
     @property
     def dateadded(self):
-        date_rec = self._video_info['dateRec']
-        return '{0}-{1}-{2} {3}'.format(date_rec[6:10], date_rec[3:5], date_rec[0:2], date_rec[11:])
+        day, month, year, time = self._video_info.date_rec
+        return '{0}-{1}-{2} {3}'.format(year, month, day, time)
 
     @property
     def mediatype(self):
         _mediatype = self._mediatype
         if _mediatype is None:
-            video_count = self._brand_info['countFullVideos']
-            has_series = (self._brand_info['hasManySeries'] == 'true')
+            video_count = self._brand_info.count_full_videos
+            has_series = self._brand_info.has_many_series
             if video_count > 1 \
                     or has_series:
                 _mediatype = 'episode'
@@ -414,12 +442,12 @@ def mediatype(self):
 
     def _title(self):
         if self.mediatype == 'episode':
-            if self._video_info['episodeTitle']:
-                title = '{0}'.format(self._video_info['episodeTitle'])
+            if self._video_info.episode_title:
+                title = '{0}'.format(self._video_info.episode_title)
             else:
-                brand_part = '{0}. '.format(self._video_info['brandTitle'])
-                if self._video_info['title'].startswith(brand_part):
-                    title = self._video_info['title'][len(brand_part):]
+                brand_part = '{0}. '.format(self._video_info.brand_title)
+                if self._video_info.title.startswith(brand_part):
+                    title = self._video_info.title[len(brand_part):]
                 else:
                     title = '{0} {1}'.format(_('Episode'), self.episode)
         else:
@@ -428,9 +456,7 @@ def _title(self):
         return title
 
     def get_thumb(self):
-        picture_item = self._video_info['pictures']
-
-        return self._get_image('lw', picture_item)
+        return self._get_art('thumb', self._video_info.images)
 
     def get_fanart(self):
         return super(VideoInfo, self).get_thumb()
@@ -443,6 +469,7 @@ class EmptyListItem(simplemedia.ListItemInfo):
     _url = None
     _path = None
     _info = None
+    _stream_properties = None
 
     @property
     def path(self):
@@ -452,12 +479,19 @@ def path(self):
     def url(self):
         return self._url
 
+    @property
+    def properties(self):
+        return dict(self._stream_properties or {})
+
     def set_url(self, url):
         self._url = url
 
     def set_path(self, path):
         self._path = path
 
+    def set_stream_properties(self, properties):
+        self._stream_properties = properties
+
 
 class ListItem(EmptyListItem):
 
@@ -489,7 +523,7 @@ def is_playable(self):
 
     @property
     def properties(self):
-        properties = {}
+        properties = super(ListItem, self).properties
 
         if self._mediatype == 'tvshow':
             properties['TotalSeasons'] = '{0}'.format(self._info.season)
@@ -521,7 +555,8 @@ def thumb(self):
 
     @property
     def fanart(self):
-        return self._info.get_fanart()
+        # The add-on fanart is local, it replaces artwork skipped by the image policy
+        return self._info.get_fanart() or self.plugin.fanart
 
     @property
     def info(self):
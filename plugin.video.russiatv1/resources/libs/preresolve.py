@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+# License: GPL v.3 https://www.gnu.org/copyleft/gpl.html
+
+from __future__ import unicode_literals
+
+import os
+import time
+from contextlib import contextmanager
+
+import simplemedia
+from future.utils import iteritems
+
+from .filelock import FileLock
+from .russiatv1 import RussiaTvError
+
+__all__ = ['remember_episodes', 'preresolve_videos', 'get_resolved_video', 'get_next_episode']
+
+addon = simplemedia.Addon()
+
+# Lifetime of pre-resolved videos, stream urls and access checks get outdated quickly
+_resolved_ttl = 10 * 60
+
+
+def remember_episodes(video_ids):
+    """
+    Remembers the order of episodes of a listing to pre-resolve the next one on play
+    """
+    if not addon.get_setting('preresolve_count'):
+        return
+
+    with _resolved_storage() as storage:
+        storage['next'] = dict(zip(video_ids, video_ids[1:]))
+
+
+def get_next_episode(video_id):
+    with _resolved_storage() as storage:
+        return storage.get('next', {}).get(video_id)
+
+
+def preresolve_videos(api, video_ids):
+    """
+    Checks access and requests videos with their brands, so play_video finds them resolved
+
+    All videos are resolved concurrently and the storage is written once.
+    """
+    # Tasks do not wait for each other, so they can not exhaust the workers
+    calls = [(video_id, api.submit(api.check_video_access, video_id), api.submit(api.video_with_brand, video_id))
+             for video_id in video_ids]
+
+    resolved = {}
+    for video_id, access, video in calls:
+        try:
+            # Access errors take precedence, as in resolve_video
+            access.result()
+            resolved[video_id] = video.result()
+        except (RussiaTvError, simplemedia.WebClientError) as e:
+            addon.log_warning('Failed to pre-resolve video {0}: {1}'.format(video_id, e))
+
+    now = time.time()
+    with _resolved_storage() as storage:
+        videos = dict((video_id, item) for video_id, item in iteritems(storage.get('videos', {}))
+                      if item['expires'] > now)
+        for video_id, (video_info, brand_info) in iteritems(resolved):
+            videos[video_id] = {'video_info': video_info,
+                                'brand_info': brand_info,
+                                'expires': now + _resolved_ttl,
+                                }
+        storage['videos'] = videos
+
+
+def get_resolved_video(video_id):
+    """
+    Returns a tuple of pre-resolved video and brand info or None
+    """
+    if not addon.get_setting('preresolve_count'):
+        return None
+
+    with _resolved_storage() as storage:
+        item = storage.get('videos', {}).get(video_id)
+
+    if item is not None \
+            and item['expires'] > time.time():
+        return item['video_info'], item['brand_info']
+
+
+@contextmanager
+def _resolved_storage():
+    # Listings write pre-resolved videos in background, while play_video of another invocation reads them
+    with FileLock(os.path.join(addon.profile_dir, '__resolved__.lock')), \
+            addon.get_storage('__resolved__.pcl') as storage:
+        yield storage
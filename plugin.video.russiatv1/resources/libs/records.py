@@ -0,0 +1,120 @@
+# -*- coding: utf-8 -*-
+# License: GPL v.3 https://www.gnu.org/copyleft/gpl.html
+
+from __future__ import unicode_literals
+
+__all__ = ['BrandRecord', 'VideoRecord']
+
+
+def _split_date(date_rec):
+    """
+    Splits the API date 'dd-mm-yyyy hh:mm:ss' into a tuple of day, month, year and time
+    """
+    if date_rec:
+        return date_rec[0:2], date_rec[3:5], date_rec[6:10], date_rec[11:]
+
+
+def _index_images(picture_item):
+    """
+    Returns a dict of image urls by preset of a picture
+    """
+    return dict((size['preset'], size['url']) for size in picture_item['sizes'])
+
+
+class BrandRecord(object):
+    """
+    Normalized brand of the /brands/ API method
+
+    Fields, that were not requested, are None.
+    """
+    __slots__ = ('id', 'title', 'body', 'title_orig', 'has_many_series', 'sort_by', 'age_restrictions',
+                 'count_full_videos', 'count_videos', 'series_is_over', 'date_rec', 'images', 'countries', 'tags',
+                 'year', 'anons', 'rank')
+
+    # API field of every record field
+    api_fields = {'id': 'id',
+                  'title': 'title',
+                  'body': 'body',
+                  'title_orig': 'titleOrig',
+                  'has_many_series': 'hasManySeries',
+                  'sort_by': 'sortBy',
+                  'age_restrictions': 'ageRestrictions',
+                  'count_full_videos': 'countFullVideos',
+                  'count_videos': 'countVideos',
+                  'series_is_over': 'seriesIsOver',
+                  'date_rec': 'dateRec',
+                  'images': 'pictures',
+                  'countries': 'countries',
+                  'tags': 'tags',
+                  'year': 'productionYearStart',
+                  'anons': 'anons',
+                  'rank': 'rank',
+                  }
+
+    def __init__(self, brand_info):
+        self.id = brand_info['id']
+        self.title = brand_info.get('title')
+        self.body = brand_info.get('body')
+        self.title_orig = brand_info.get('titleOrig')
+        self.has_many_series = (brand_info.get('hasManySeries') == 'true')
+        self.sort_by = brand_info.get('sortBy')
+        self.age_restrictions = brand_info.get('ageRestrictions')
+        self.count_full_videos = brand_info.get('countFullVideos')
+        self.count_videos = brand_info.get('countVideos')
+        self.series_is_over = (brand_info.get('seriesIsOver') == 'true')
+        self.date_rec = _split_date(brand_info.get('dateRec'))
+        self.images = [_index_images(picture_item) for picture_item in brand_info.get('pictures') or []]
+
+        countries = brand_info.get('countries')
+        self.countries = [country['title'] for country in countries] if countries is not None else None
+
+        tags = brand_info.get('tags')
+        self.tags = [tag['title'] for tag in tags] if tags is not None else None
+
+        year = brand_info.get('productionYearStart')
+        self.year = int(year) if year else None
+
+        self.anons = brand_info.get('anons')
+        self.rank = brand_info.get('rank')
+
+
+class VideoRecord(object):
+    """
+    Normalized video of the /videos/ API method
+
+    Fields, that were not requested, are None.
+    """
+    __slots__ = ('id', 'title', 'anons', 'brand_id', 'series', 'duration', 'sources', 'images', 'episode_title',
+                 'date_rec', 'brand_title', 'video_type')
+
+    # API field of every record field
+    api_fields = {'id': 'id',
+                  'title': 'title',
+                  'anons': 'anons',
+                  'brand_id': 'brandId',
+                  'series': 'series',
+                  'duration': 'duration',
+                  'sources': 'sources',
+                  'images': 'pictures',
+                  'episode_title': 'episodeTitle',
+                  'date_rec': 'dateRec',
+                  'brand_title': 'brandTitle',
+                  'video_type': 'videoType',
+                  }
+
+    def __init__(self, video_info):
+        self.id = video_info['id']
+        self.title = video_info.get('title')
+        self.anons = video_info.get('anons')
+        self.brand_id = video_info.get('brandId')
+        self.series = video_info.get('series')
+        self.duration = video_info.get('duration')
+        self.sources = video_info.get('sources')
+
+        pictures = video_info.get('pictures')
+        self.images = _index_images(pictures) if pictures is not None else None
+
+        self.episode_title = video_info.get('episodeTitle')
+        self.date_rec = _split_date(video_info.get('dateRec'))
+        self.brand_title = video_info.get('brandTitle')
+        self.video_type = video_info.get('videoType')
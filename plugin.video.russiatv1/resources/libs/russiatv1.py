@@ -3,8 +3,17 @@
 
 from __future__ import unicode_literals
 
+import threading
+import time
+
 import requests
-from future.utils import python_2_unicode_compatible
+from future.utils import python_2_unicode_compatible, iteritems
+from requests.adapters import HTTPAdapter
+
+from .adaptive import PageSizer, ThroughputMeter
+from .executor import Executor
+from .jsondecoder import get_decoder
+from .tracing import Tracer
 
 __all__ = ['RussiaTvClient', 'RussiaTvError']
 
@@ -17,28 +26,225 @@ class RussiaTvError(Exception):
 class RussiaTvClient(object):
     _api_url = 'https://api.vgtrk.com/api/v1'
 
-    def __init__(self, channels):
+    # Lifetime of cached responses in seconds, 0 disables caching
+    _cache_ttl = {'menu': 10 * 60,
+                  'brands': 30 * 60,
+                  'brands_search': 30 * 60,
+                  'brand_info': 24 * 60 * 60,
+                  'videos': 30 * 60,
+                  'video': 60 * 60,
+                  'check_video_access': 0,
+                  }
+
+    # Endpoints of listings, that may be served from an expired cache entry
+    _stale_endpoints = ['menu', 'brands', 'brands_search', 'brand_info', 'videos']
+    # How long an expired entry is served while revalidating and as a fallback on errors
+    _max_stale = 24 * 60 * 60
+    _max_stale_fallback = 30 * 24 * 60 * 60
+
+    _transport_errors = (requests.RequestException,)
+
+    # Size of the beginning of a stream, that is downloaded to measure the throughput
+    _probe_size = 512 * 1024
+
+    # Fields requested by routes: 'listing' for lists of items, 'detail' for brand pages
+    # and 'playback' for the played item
+    _brand_profiles = {'listing': ['id', 'title', 'body', 'titleOrig', 'hasManySeries', 'sortBy', 'ageRestrictions',
+                                   'countFullVideos', 'countVideos', 'seriesIsOver', 'dateRec', 'pictures',
+                                   'countries', 'tags', 'productionYearStart', 'anons', 'rank'],
+                       'detail': ['id', 'title', 'body', 'titleOrig', 'hasManySeries', 'sortBy', 'ageRestrictions',
+                                  'countFullVideos', 'dateRec', 'pictures', 'countries', 'tags',
+                                  'productionYearStart', 'anons', 'rank'],
+                       }
+    _brand_profiles['playback'] = _brand_profiles['detail']
+
+    _video_profiles = {'listing': ['id', 'title', 'anons', 'series', 'duration', 'pictures', 'episodeTitle', 'dateRec',
+                                   'brandTitle'],
+                       'playback': ['id', 'title', 'anons', 'brandId', 'series', 'duration', 'sources', 'pictures',
+                                    'episodeTitle', 'dateRec', 'brandTitle', 'videoType'],
+                       }
+    _video_profiles['detail'] = _video_profiles['listing']
+
+    def __init__(self, channels, max_workers=4, cache=None, stale_while_revalidate=False, tracer=None,
+                 page_sizer=None, json_decoder=None, throughput_meter=None):
 
         self._channels = channels
-        self._client = requests.Session()
+        self._tracer = tracer or Tracer()
+        self.page_sizer = page_sizer or PageSizer()
+        self.throughput_meter = throughput_meter or ThroughputMeter()
+        self._executor = Executor(max_workers)
+        self.json_decoder, self._json_loads = get_decoder(json_decoder)
+        self._cache = cache
+        self._stale_while_revalidate = stale_while_revalidate
+
+        self._background = []
+        self._lock = threading.Lock()
 
-        self._brand_includes = ['id', 'title', 'body', 'titleOrig', 'titleOrig', 'hasManySeries', 'sortBy',
-                                'ageRestrictions', 'countFullVideos', 'countVideos', 'seriesIsOver', 'dateRec',
-                                'pictures', 'countries', 'tags', 'personTypes', 'productionYearStart', 'anons',
-                                'rank']
-        self._video_includes = ['id', 'title', 'anons', 'episodeId', 'brandId', 'series', 'duration', 'sources',
-                                'pictures', 'episodeTitle', 'dateRec', 'brandTitle', 'videoType']
+        self._client = None
+        self._init_session(requests.Session())
 
     def __str__(self):
         return '<RussiaTvClient>'
 
     def __del__(self):
+        self.close()
+
+    def close(self):
+        if self._client is None:
+            return
+
+        self.wait_background()
+        self._executor.shutdown()
         self._client.close()
+        self._client = None
+
+    def _init_session(self, session):
+        if self._client is not None:
+            self._client.close()
+
+        # One connection pool shared by all worker threads
+        pool_size = max(self._executor.max_workers, 1)
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+
+        self._client = session
+
+    @property
+    def has_cache(self):
+        """
+        Returns True, if API responses are kept in the response cache
+        """
+        return self._cache is not None
+
+    def submit(self, func, *args, **kwargs):
+        return self._executor.submit(func, *args, **kwargs)
+
+    def gather(self, *calls):
+        """
+        Executes calls concurrently and returns results in the order of calls
+
+        Each call is a tuple of a client method and its positional arguments.
+        The first raised exception is propagated after all calls are done.
+        """
+        futures = [self.submit(call[0], *call[1:]) for call in calls]
+
+        for future in futures:
+            future.exception()
+
+        return [future.result() for future in futures]
+
+    def submit_background(self, func, *args, **kwargs):
+        """
+        Submits a call, that the client waits for before closing
+
+        The call never blocks the caller, even if the worker pool is disabled.
+        """
+        future = self._executor.submit_async(func, *args, **kwargs)
+        with self._lock:
+            self._background.append(future)
+        return future
+
+    def wait_background(self, timeout=None):
+        while True:
+            with self._lock:
+                if not self._background:
+                    break
+                future = self._background.pop()
+            future.exception(timeout)
+
+    def _get_json(self, endpoint, url, params, paged=False):
+        """
+        Returns the decoded response of an API call
+
+        Timings of ``paged`` calls, that request a listing page, are sampled for the adaptive page size.
+        """
+        with self._tracer.span('api', endpoint=endpoint, params=self._trace_params(params)) as span:
+            span['cache'] = 'none'
+            return self._get_cached_json(endpoint, url, params, span, paged)
+
+    def _get_cached_json(self, endpoint, url, params, span, paged):
+        ttl = self._cache_ttl.get(endpoint, 0)
+        use_stale = self._stale_while_revalidate and endpoint in self._stale_endpoints
+
+        key = None
+        entry = None
+        if self._cache is not None \
+                and ttl:
+            key = self._cache.make_key(url, params)
+            # Expired entries are still useful for conditional requests
+            entry = self._cache.get(key, self._max_stale_fallback)
+            span['cache'] = 'miss'
+            if entry is not None:
+                now = time.time()
+                if entry['expires'] >= now:
+                    span['cache'] = 'hit'
+                    return self._load_json(entry['body'])
+                elif use_stale \
+                        and entry['expires'] + self._max_stale >= now:
+                    # Serve the last good response and refresh it in background
+                    span['cache'] = 'stale'
+                    self.submit_background(self._fetch_json, endpoint, url, params, key, ttl, entry, paged)
+                    return self._load_json(entry['body'])
+
+                span['cache'] = 'expired'
+
+        try:
+            return self._fetch_json(endpoint, url, params, key, ttl, entry, paged)
+        except (RussiaTvError,) + self._transport_errors:
+            if entry is None \
+                    or not use_stale:
+                raise
+
+        span['cache'] = 'fallback'
+        return self._load_json(entry['body'])
+
+    def _fetch_json(self, endpoint, url, params, key=None, ttl=0, entry=None, paged=False):
+        headers = {}
+        if entry is not None:
+            if entry['etag']:
+                headers['If-None-Match'] = entry['etag']
+            if entry['last_modified']:
+                headers['If-Modified-Since'] = entry['last_modified']
+
+        with self._tracer.span('http', url=url, params=self._trace_params(params)) as span:
+            start = time.time()
+            r = self._client.get(url, params=params, headers=headers)
+            elapsed = time.time() - start
+            span['status'] = r.status_code
+            span['bytes'] = len(r.content)
+
+            not_modified = (r.status_code == 304 and entry is not None)
+            if not_modified:
+                # The cached body is not downloaded again
+                span['saved_bytes'] = len(entry['body'])
+
+        if not_modified:
+            self._cache.refresh(key, ttl)
+            return self._load_json(entry['body'])
+
+        j = self._load_json(r.content)
+
+        if paged:
+            self.page_sizer.add_sample(endpoint, len(j['data']), elapsed)
+
+        if key is not None:
+            self._cache.set(key, r.content, ttl, r.headers.get('ETag'), r.headers.get('Last-Modified'))
+
+        return j
+
+    def _load_json(self, content):
+        with self._tracer.stage('extract_json'):
+            return self._extract_json(content, self._json_loads)
+
+    def _trace_params(self, params):
+        if self._tracer.enabled:
+            return dict((name, value) for name, value in iteritems(params) if value is not None)
 
     @staticmethod
-    def _extract_json(r):
+    def _extract_json(content, json_loads):
         try:
-            json = r.json()
+            json = json_loads(content)
         except ValueError as err:
             raise RussiaTvError(err)
 
@@ -66,29 +272,42 @@ def menu(self, limit=None, offset=None):
                   'includes': ':'.join(includes),
                   }
 
-        r = self._client.get(url, params=params)
-        j = self._extract_json(r)
+        j = self._get_json('menu', url, params)
 
         return j
 
-    def brands(self, tags, limit, offset, keyword=None):
+    def menu_all(self):
+        """
+        Returns all menu items, the rest of them is requested if the first page is incomplete
+        """
+        menu_result = self.menu()
+        menu_items = menu_result['data']
+
+        if menu_result['pagination']['totalCount'] > menu_result['pagination']['limit']:
+            offset = menu_result['pagination']['limit']
+            limit = menu_result['pagination']['totalCount'] - offset
+            menu_result = self.menu(limit, offset)
+            menu_items.extend(menu_result['data'])
+
+        return menu_items
+
+    def brands(self, tags, limit, offset, keyword=None, profile='listing'):
         url = self._api_url + '/brands/'
 
         params = {'channels': self._channels,
                   'offset': offset,
                   'limit': limit,
-                  'includes': ':'.join(self._brand_includes),
+                  'includes': ':'.join(self._brand_profiles[profile]),
                   'hasFullVideos': 'true',
-                  'tags': ':'.join(tags),
+                  'tags': ':'.join(tags) if tags else None,
                   'search': keyword,
                   }
 
-        r = self._client.get(url, params=params)
-        j = self._extract_json(r)
+        j = self._get_json('brands', url, params, paged=True)
 
         return j
 
-    def brands_search(self, keyword, limit, offset):
+    def brands_search(self, keyword, limit, offset, profile='listing'):
         url = self._api_url + '/brands/'
 
         keyword = keyword.replace('+', ' ')
@@ -100,32 +319,33 @@ def brands_search(self, keyword, limit, offset):
         params = {'channels': self._channels,
                   'offset': offset,
                   'limit': limit,
-                  'includes': ':'.join(self._brand_includes),
+                  'includes': ':'.join(self._brand_profiles[profile]),
                   'hasFullVideos': 'true',
                   'titleSuggest': keyword,
                   }
 
-        r = self._client.get(url, params=params)
-        j = self._extract_json(r)
+        j = self._get_json('brands_search', url, params, paged=True)
 
         return j
 
-    def brand_info(self, brand_id):
+    def brand_info(self, brand_id, profile='detail'):
         url = self._api_url + '/brands/{0}/'.format(brand_id)
 
-        params = {'includes': ':'.join(self._brand_includes),
+        params = {'includes': ':'.join(self._brand_profiles[profile]),
                   }
 
-        r = self._client.get(url, params=params)
-        j = self._extract_json(r)
+        j = self._get_json('brand_info', url, params)
 
         return j['data']
 
-    def videos(self, brand_id, sort, limit=1, offset=0, video_type=1, includes=None):
+    def videos(self, brand_id, sort, limit=1, offset=0, video_type=1, includes=None, profile='listing', paged=False):
         url = self._api_url + '/videos/'
 
         if includes is None:
-            includes = self._video_includes
+            includes = self._video_profiles[profile]
+
+        if isinstance(brand_id, (list, tuple)):
+            brand_id = ':'.join([str(item) for item in brand_id])
 
         params = {'brands': brand_id,
                   # 'channels': self._channels,
@@ -139,19 +359,17 @@ def videos(self, brand_id, sort, limit=1, offset=0, video_type=1, includes=None)
                   'sortOrder': 'asc',
                   }
 
-        r = self._client.get(url, params=params)
-        j = self._extract_json(r)
+        j = self._get_json('videos', url, params, paged)
 
         return j
 
-    def video(self, video_id):
+    def video(self, video_id, profile='playback'):
         url = self._api_url + '/videos/{0}/'.format(video_id)
 
-        params = {'includes': ':'.join(self._video_includes),
+        params = {'includes': ':'.join(self._video_profiles[profile]),
                   }
 
-        r = self._client.get(url, params=params)
-        j = self._extract_json(r)
+        j = self._get_json('video', url, params)
 
         return j['data']
 
@@ -161,8 +379,7 @@ def check_video_access(self, video_id):
                   'sid': 'russiatv',
                   }
 
-        r = self._client.get(url, params=params)
-        j = self._extract_json(r)
+        j = self._get_json('check_video_access', url, params)
 
         medialist = j['data']['playlist']['medialist']
 
@@ -170,3 +387,56 @@ def check_video_access(self, video_id):
             if item['id'] == video_id \
                     and item['errors']:
                 raise RussiaTvError(item['errors'])
+
+    def probe_stream(self, url):
+        """
+        Downloads the beginning of a stream and samples the throughput of the video CDN
+
+        The time to the response headers is left out, so the latency does not reduce the estimate.
+        """
+        headers = {'Range': 'bytes=0-{0}'.format(self._probe_size - 1)}
+
+        with self._tracer.span('http', url=url, params=None) as span:
+            r = self._client.get(url, headers=headers, stream=True)
+            try:
+                start = time.time()
+                size = 0
+                for chunk in r.iter_content(64 * 1024):
+                    size += len(chunk)
+                    if size >= self._probe_size:
+                        break
+                elapsed = time.time() - start
+            finally:
+                r.close()
+            span['status'] = r.status_code
+            span['bytes'] = size
+
+        self.throughput_meter.add_sample(size, elapsed)
+
+    def resolve_video(self, video_id):
+        """
+        Returns video and brand info of a playable video
+
+        The access check runs concurrently with the video -> brand_info chain,
+        access errors take precedence over errors of the chain.
+        """
+        access = self.submit(self.check_video_access, video_id)
+
+        try:
+            video_info, brand_info = self.video_with_brand(video_id)
+        except Exception:
+            access.result()
+            raise
+
+        access.result()
+
+        return video_info, brand_info
+
+    def video_with_brand(self, video_id):
+        """
+        Returns video and brand info of a video without the access check
+        """
+        video_info = self.video(video_id)
+        brand_info = self.brand_info(video_info['brandId'], 'playback')
+
+        return video_info, brand_info
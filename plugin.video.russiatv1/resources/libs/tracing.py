@@ -0,0 +1,120 @@
+# -*- coding: utf-8 -*-
+# License: GPL v.3 https://www.gnu.org/copyleft/gpl.html
+
+from __future__ import unicode_literals
+
+import io
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+import simplemedia
+from future.utils import iteritems
+
+__all__ = ['Tracer', 'tracer', 'write_trace']
+
+addon = simplemedia.Addon()
+
+
+class Tracer(object):
+    """
+    Collects spans of API calls and timings of listing stages of one invocation
+
+    A disabled tracer yields throwaway span dicts, so instrumented code does not
+    need to check whether tracing is enabled.
+    """
+
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+
+        self._lock = threading.Lock()
+        self._start = time.time()
+        self._spans = []
+        self._stages = {}
+
+    def reset(self):
+        with self._lock:
+            self._start = time.time()
+            self._spans = []
+            self._stages = {}
+
+    @contextmanager
+    def span(self, kind, **attrs):
+        span = attrs
+        if not self.enabled:
+            yield span
+            return
+
+        span['kind'] = kind
+        span['thread'] = threading.current_thread().name
+        span['start_ms'] = self._elapsed_ms(time.time())
+
+        start = time.time()
+        try:
+            yield span
+        except Exception as e:
+            span['error'] = type(e).__name__
+            raise
+        finally:
+            span['latency_ms'] = round((time.time() - start) * 1000, 2)
+            with self._lock:
+                self._spans.append(span)
+
+    @contextmanager
+    def stage(self, name):
+        if not self.enabled:
+            yield
+            return
+
+        start = time.time()
+        try:
+            yield
+        finally:
+            duration = time.time() - start
+            with self._lock:
+                stage = self._stages.setdefault(name, {'count': 0, 'total_ms': 0.0})
+                stage['count'] += 1
+                stage['total_ms'] += duration * 1000
+
+    def summary(self):
+        with self._lock:
+            spans = list(self._spans)
+            stages = dict((name, {'count': stage['count'], 'total_ms': round(stage['total_ms'], 2)})
+                          for name, stage in iteritems(self._stages))
+
+        http_spans = [span for span in spans if span['kind'] == 'http']
+
+        return {'started': time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(self._start)),
+                'duration_ms': self._elapsed_ms(time.time()),
+                'requests': len(http_spans),
+                'bytes': sum([span.get('bytes', 0) for span in http_spans]),
+                'saved_bytes': sum([span.get('saved_bytes', 0) for span in http_spans]),
+                'stages': stages,
+                'spans': spans,
+                }
+
+    def _elapsed_ms(self, moment):
+        return round((moment - self._start) * 1000, 2)
+
+
+# tracing: 0 - disabled, 1 - Kodi log, 2 - JSONL file in the profile folder
+tracer = Tracer(addon.get_setting('tracing') != 0)
+
+
+def write_trace(path):
+    tracing = addon.get_setting('tracing')
+    if not tracing:
+        return
+
+    summary = tracer.summary()
+    summary['path'] = path
+
+    line = json.dumps(summary, ensure_ascii=False, sort_keys=True)
+    if tracing == 1:
+        addon.log_notice('Trace: {0}'.format(line))
+    else:
+        trace_file = os.path.join(addon.profile_dir, 'trace.jsonl')
+        with io.open(trace_file, 'a', encoding='utf-8') as f:
+            f.write(line + '\n')
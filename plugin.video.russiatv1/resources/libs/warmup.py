@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+# License: GPL v.3 https://www.gnu.org/copyleft/gpl.html
+
+from __future__ import unicode_literals
+
+import os
+from contextlib import contextmanager
+
+import simplemedia
+
+from .filelock import FileLock
+
+__all__ = ['remember_brand', 'remember_season', 'get_recent']
+
+addon = simplemedia.Addon()
+
+# Number of recently opened brands and season pages warmed up by the service
+_recent_limit = 20
+
+
+def remember_brand(brand_id):
+    """
+    Remembers a recently opened brand for the cache warm-up service
+    """
+    if not addon.get_setting('prefetch'):
+        return
+
+    with _warmup_storage() as storage:
+        brands = [item for item in storage.get('brands', []) if item != brand_id]
+        brands.insert(0, brand_id)
+        storage['brands'] = brands[:_recent_limit]
+
+
+def remember_season(brand_id, sort, limit, offset):
+    """
+    Remembers a season page being watched, the service warms up the next one
+    """
+    if not addon.get_setting('prefetch'):
+        return
+
+    with _warmup_storage() as storage:
+        seasons = [item for item in storage.get('seasons', []) if item['brand_id'] != brand_id]
+        seasons.insert(0, {'brand_id': brand_id,
+                           'sort': sort,
+                           'limit': limit,
+                           'offset': offset,
+                           })
+        storage['seasons'] = seasons[:_recent_limit]
+
+
+def get_recent():
+    with _warmup_storage() as storage:
+        return list(storage.get('brands', [])), list(storage.get('seasons', []))
+
+
+@contextmanager
+def _warmup_storage():
+    # Plugin invocations remember brands and seasons, while the service reads them
+    with FileLock(os.path.join(addon.profile_dir, '__warmup__.lock')), \
+            addon.get_storage('__warmup__.pcl') as storage:
+        yield storage
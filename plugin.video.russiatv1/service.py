@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*-
+# License: GPL v.3 https://www.gnu.org/copyleft/gpl.html
+
+from __future__ import unicode_literals
+
+import simplemedia
+import xbmc
+
+from resources.libs import (RussiaTv, RussiaTvError,
+                            tracer, write_trace, get_catalogue, update_catalogue, get_recent,
+                            get_library_exporter)
+
+addon = simplemedia.Addon()
+
+
+class WarmUpAborted(Exception):
+    pass
+
+
+class CacheWarmer(object):
+    """
+    Warms up the response cache on a schedule
+
+    Requests are the same as the plugin makes, so the plugin finds them in the
+    cache. Requests are spaced out according to the 'prefetch_rate' setting.
+    The local catalogue and brands exported to the library are updated on the
+    same schedule.
+    """
+
+    def __init__(self):
+        self._monitor = xbmc.Monitor()
+
+    def run(self):
+        # Jobs with the settings, that enable them
+        jobs = [(self.warm_up, ['prefetch', 'cache_size']),
+                (self.update_catalogue, ['local_search']),
+                (self.update_library, ['library_update']),
+                ]
+
+        while not self._monitor.abortRequested():
+            try:
+                for job, setting_ids in jobs:
+                    if all([addon.get_setting(setting_id) for setting_id in setting_ids]):
+                        self._run_job(job)
+            except WarmUpAborted:
+                break
+
+            if self._monitor.waitForAbort(addon.get_setting('prefetch_interval') * 60):
+                break
+
+    @staticmethod
+    def _run_job(job):
+        # The service runs for the whole session, so the trace is written and reset after every job
+        tracer.reset()
+        try:
+            job()
+        finally:
+            RussiaTv.release_instance()
+            write_trace('service/{0}'.format(job.__name__))
+
+    def warm_up(self):
+        api = RussiaTv.get_instance()
+
+        # The same page size as the plugin requests, so the menu pages are found in the cache
+        limit = api.page_size('brands', 'limit')
+
+        menu_items = self._call(api.menu_all) or []
+        for menu_item in menu_items:
+            tags = [str(tag['id']) for tag in menu_item['tags']]
+            self._call(api.brands, tags, limit, 0)
+
+        brands, seasons = get_recent()
+        for brand_id in brands:
+            self._call(api.brand_info, brand_id)
+
+        for season in seasons:
+            self._call(api.videos, season['brand_id'], season['sort'], season['limit'], season['offset'] + 1)
+
+    def update_catalogue(self):
+        """
+        Completes the update pass of the local catalogue, when it is outdated
+        """
+        catalogue = get_catalogue()
+        if catalogue.outdated:
+            api = RussiaTv.get_instance()
+            while self._call(update_catalogue, api, catalogue, 1) is False:
+                pass
+
+    def update_library(self):
+        """
+        Starts the export of new episodes of the brands, that were exported to the library
+
+        The export runs in the plugin, which builds STRM urls with its routes.
+        """
+        if get_library_exporter().brands:
+            xbmc.executebuiltin('RunPlugin(plugin://{0}/library/update/)'.format(addon.id))
+
+    def _call(self, func, *args):
+        if self._monitor.waitForAbort(60.0 / addon.get_setting('prefetch_rate')):
+            raise WarmUpAborted()
+
+        try:
+            return func(*args)
+        except (RussiaTvError, simplemedia.WebClientError) as e:
+            addon.log_error('Cache warm-up request failed: {0}'.format(e))
+
+
+if __name__ == '__main__':
+    CacheWarmer().run()
@@ -3,6 +3,8 @@
 from __future__ import print_function, unicode_literals
 
 import imp
+import itertools
+import json
 import os
 import shutil
 import sys
@@ -14,6 +16,8 @@
 import xbmcaddon
 import xbmc
 
+from fixtures import FixtureAdapter, use_fixtures
+
 cwd = os.path.dirname(os.path.abspath(__file__))
 
 addon_name = 'plugin.video.russiatv1'
@@ -35,12 +39,29 @@
 # Import our module being tested
 sys.path.append(addon_dir)
 
+from resources.libs import (BrandInfo, SeasonInfo, VideoInfo, EmptyListItem, ListItem,  # noqa: E402
+                            BrandRecord, VideoRecord)
+from resources.libs.cache import ResponseCache  # noqa: E402
+from resources.libs.catalogue import Catalogue  # noqa: E402
+from resources.libs.library import LibraryExporter  # noqa: E402
+from resources.libs.russiatv1 import RussiaTvClient, RussiaTvError  # noqa: E402
+from resources.libs.tracing import Tracer  # noqa: E402
+
+# Set to 'replay' to run against recorded API responses or 'record' to record them
+fixtures_mode = os.environ.get('RUSSIATV_FIXTURES')
+fixtures_patcher = None
+
 
 def run_script():
     imp.load_source('__main__', os.path.join(addon_dir, 'default.py'))
 
 
 def setUpModule():
+    global fixtures_patcher
+    if fixtures_mode:
+        fixtures_patcher = use_fixtures(FixtureAdapter(mode=fixtures_mode))
+        fixtures_patcher.start()
+
     # Prepare search history
     addon = simpleplugin.Addon()
     with addon.get_storage('__history__.pcl') as storage:
@@ -49,6 +70,9 @@ def setUpModule():
 
 
 def tearDownModule():
+    if fixtures_patcher is not None:
+        fixtures_patcher.stop()
+
     print('Removing temporary directory: {0}'.format(temp_dir))
     shutil.rmtree(temp_dir, True)
 
@@ -136,6 +160,396 @@ def test_14_search_remove():
     def test_15_search_clear():
         run_script()
 
+    @staticmethod
+    @mock.patch('simpleplugin.sys.argv', ['plugin://{0}/brand/9361/episode/'.format(addon_name), '16', '?limit=10'])
+    def test_16_brand_jump():
+        xbmc.Keyboard.strings.append('25')
+        run_script()
+
+    @staticmethod
+    @mock.patch('simpleplugin.sys.argv', ['plugin://{0}/library/brand/9361/'.format(addon_name), '17', ''])
+    def test_17_library_brand():
+        run_script()
+
+    @staticmethod
+    @mock.patch('simpleplugin.sys.argv', ['plugin://{0}/library/menu/267/'.format(addon_name), '18', ''])
+    def test_18_library_menu():
+        run_script()
+
+    @staticmethod
+    @mock.patch('simpleplugin.sys.argv', ['plugin://{0}/library/update/'.format(addon_name), '19', ''])
+    def test_19_library_update():
+        run_script()
+
+
+def field_recorder(record_class):
+    """
+    Returns a record class, that records API names of the fields read from a record
+    """
+
+    class FieldRecorder(record_class):
+        __slots__ = ('fields', 'read')
+
+        def __init__(self, item, fields):
+            super(FieldRecorder, self).__init__(dict((name, value) for name, value in item.items() if name in fields))
+            self.fields = fields
+            self.read = set()
+
+        def __getattribute__(self, name):
+            api_field = record_class.api_fields.get(name)
+            if api_field is not None:
+                object.__getattribute__(self, 'read').add(api_field)
+            return object.__getattribute__(self, name)
+
+    return FieldRecorder
+
+
+BrandRecorder = field_recorder(BrandRecord)
+VideoRecorder = field_recorder(VideoRecord)
+
+
+class IncludeProfilesTestCase(unittest.TestCase):
+    brand = {'id': 9361,
+             'title': 'Тайны следствия-18',
+             'body': 'Описание сериала.\r\nВ ролях: Анна Ковальчук, Владимир Фекленко<br />'
+                     'Режиссер: Андрей Бенкендорф\r\nСценарий: Елена Ласкарева',
+             'titleOrig': '',
+             'hasManySeries': 'true',
+             'sortBy': 'series',
+             'ageRestrictions': 12,
+             'countFullVideos': 45,
+             'countVideos': 47,
+             'seriesIsOver': 'false',
+             'dateRec': '15-02-2018 12:00:00',
+             'pictures': [{'sizes': [{'preset': preset, 'url': 'https://cdn/{0}.jpg'.format(preset)}
+                                     for preset in ['prm', 'bp', 'hdr', 'lw']]}],
+             'countries': [{'title': 'Россия'}],
+             'tags': [{'title': 'Детективы'}],
+             'personTypes': [{'title': 'Актеры'}],
+             'productionYearStart': 2018,
+             'anons': '<p>Анонс</p>',
+             'rank': 7,
+             }
+
+    movie = dict(brand, id=62314, title='Красная Шапочка. Х/ф', hasManySeries='false', countFullVideos=1,
+                 countVideos=2)
+
+    video = {'id': 2248791,
+             'title': 'Тайны следствия-18. Серия 3',
+             'anons': 'Анонс серии',
+             'episodeId': 173920,
+             'brandId': 9361,
+             'series': 3,
+             'duration': 2700,
+             'sources': {'mp4': {'high': 'https://cdn/high.mp4'}},
+             'pictures': {'sizes': [{'preset': 'lw', 'url': 'https://cdn/lw.jpg'}]},
+             'episodeTitle': '',
+             'dateRec': '20-02-2018 21:00:00',
+             'brandTitle': 'Тайны следствия-18',
+             'videoType': 1,
+             }
+
+    @classmethod
+    @mock.patch('simpleplugin.sys.argv', ['plugin://{0}/'.format(addon_name), '1', ''])
+    def setUpClass(cls):
+        BrandInfo.plugin = simplemedia.RoutedPlugin()
+        EmptyListItem.plugin = BrandInfo.plugin
+
+    def setUp(self):
+        print("Running test: {0}".format(self.id().split('.')[-1]))
+
+    def _brand(self, profile, brand=None):
+        return BrandRecorder(brand or self.brand, RussiaTvClient._brand_profiles[profile])
+
+    def _video(self, profile):
+        return VideoRecorder(self.video, RussiaTvClient._video_profiles[profile])
+
+    def _assert_rendered(self, item_info, *items):
+        ListItem(item_info).get_item()
+
+        for item in items:
+            self.assertTrue(item.read)
+            self.assertEqual(item.read - set(item.fields), set())
+
+    def test_01_brands_listing(self):
+        for brand in [self.brand, self.movie]:
+            for atl_names in [False, True]:
+                brand_info = self._brand('listing', brand)
+                self._assert_rendered(BrandInfo(brand_info, atl_names=atl_names), brand_info)
+
+    def test_02_seasons_detail(self):
+        brand_info = self._brand('detail')
+        item_info = SeasonInfo(brand_info, 20, self.brand['countFullVideos'])
+        item_info.set_offset(1)
+        self._assert_rendered(item_info, brand_info)
+
+    def test_03_episodes_listing(self):
+        for atl_names in [False, True]:
+            brand_info = self._brand('detail')
+            video_info = self._video('listing')
+            self._assert_rendered(VideoInfo(brand_info, video_info, atl_names=atl_names), brand_info, video_info)
+
+    def test_04_video_playback(self):
+        for brand in [self.brand, self.movie]:
+            brand_info = self._brand('playback', brand)
+            video_info = self._video('playback')
+            self._assert_rendered(VideoInfo(brand_info, video_info, for_play=True), brand_info, video_info)
+
+
+class ResponseCacheTestCase(unittest.TestCase):
+
+    def setUp(self):
+        print("Running test: {0}".format(self.id().split('.')[-1]))
+
+        self.cache_file = os.path.join(temp_dir, 'responses_test.db')
+        self.cache = ResponseCache(self.cache_file, 100)
+
+    def tearDown(self):
+        self.cache.close()
+        os.remove(self.cache_file)
+
+    def test_01_expiration(self):
+        self.cache.set('a', b'body', 60, '"v1"')
+
+        entry = self.cache.get('a')
+        self.assertEqual(entry['body'], b'body')
+        self.assertEqual(entry['etag'], '"v1"')
+
+        self.cache.refresh('a', -60)
+        self.assertIsNone(self.cache.get('a'))
+        self.assertEqual(self.cache.get('a', 120)['body'], b'body')
+
+    def test_02_lru_eviction(self):
+        with mock.patch('resources.libs.cache.time') as clock:
+            clock.time.side_effect = itertools.count(1000)
+
+            self.cache.set('a', b'a' * 40, 3600)
+            self.cache.set('b', b'b' * 40, 3600)
+            self.cache.get('a')
+            self.cache.set('c', b'c' * 40, 3600)
+            self.cache.set('d', b'd' * 101, 3600)
+
+            self.assertIsNotNone(self.cache.get('a'))
+            self.assertIsNone(self.cache.get('b'))
+            self.assertIsNotNone(self.cache.get('c'))
+            self.assertIsNone(self.cache.get('d'))
+
+
+class CachedClient(RussiaTvClient):
+    _transport_errors = (simplemedia.WebClientError,)
+
+
+class ClientCacheTestCase(unittest.TestCase):
+    menu = {'data': [{'id': 265, 'title': 'Сериалы', 'tags': []}],
+            'pagination': {'totalCount': 1, 'limit': 100, 'offset': 0},
+            }
+
+    video = {'data': IncludeProfilesTestCase.video,
+             }
+
+    error = {'metadata': {'code': 500, 'errorMessage': 'Internal Server Error'},
+             }
+
+    def setUp(self):
+        print("Running test: {0}".format(self.id().split('.')[-1]))
+
+        self.cache_file = os.path.join(temp_dir, 'responses_test.db')
+        self.cache = ResponseCache(self.cache_file, 1024 * 1024)
+        self.tracer = Tracer(True)
+
+        self.session = mock.Mock()
+        self.session.get.return_value = self._response(200, self.menu, '"v1"')
+
+        self.client = CachedClient(1, max_workers=0, cache=self.cache, stale_while_revalidate=True,
+                                   tracer=self.tracer)
+        self.client._init_session(self.session)
+
+    def tearDown(self):
+        self.client.close()
+        self.cache.close()
+        os.remove(self.cache_file)
+
+    @staticmethod
+    def _response(status_code, data=None, etag=None):
+        content = json.dumps(data).encode('utf-8') if data is not None else b''
+        headers = {'ETag': etag} if etag else {}
+        return mock.Mock(status_code=status_code, content=content, headers=headers)
+
+    def _expire(self, age):
+        # Makes the response of the last request expired ``age`` seconds ago
+        args, kwargs = self.session.get.call_args
+        self.cache.refresh(self.cache.make_key(args[0], kwargs['params']), -age)
+
+    def test_01_fresh_hit(self):
+        self.assertEqual(self.client.menu(), self.menu)
+        self.assertEqual(self.client.menu(), self.menu)
+        self.assertEqual(self.session.get.call_count, 1)
+
+    def test_02_stale_while_revalidate(self):
+        menu = dict(self.menu, data=[])
+
+        self.client.menu()
+        self._expire(60)
+        self.session.get.return_value = self._response(200, menu, '"v2"')
+
+        # The expired response is served, while the background request refreshes it
+        self.assertEqual(self.client.menu(), self.menu)
+        self.client.wait_background()
+        self.assertEqual(self.session.get.call_count, 2)
+        self.assertEqual(self.session.get.call_args[1]['headers'], {'If-None-Match': '"v1"'})
+
+        self.assertEqual(self.client.menu(), menu)
+        self.assertEqual(self.session.get.call_count, 2)
+
+    def test_03_stale_fallback(self):
+        self.client.menu()
+        self._expire(2 * RussiaTvClient._max_stale)
+
+        self.session.get.side_effect = simplemedia.WebClientError('Connection refused')
+        self.assertEqual(self.client.menu(), self.menu)
+
+        self.session.get.side_effect = None
+        self.session.get.return_value = self._response(200, self.error)
+        self.assertEqual(self.client.menu(), self.menu)
+
+        # Errors are raised, if there is no response to fall back to
+        with self.assertRaises(RussiaTvError):
+            self.client.menu(limit=10)
+
+    def test_04_not_modified(self):
+        self.session.get.return_value = self._response(200, self.video, '"v1"')
+        body_size = len(self.session.get.return_value.content)
+
+        self.assertEqual(self.client.video(2248791), self.video['data'])
+        self._expire(60)
+        self.session.get.return_value = self._response(304)
+
+        self.assertEqual(self.client.video(2248791), self.video['data'])
+        self.assertEqual(self.session.get.call_args[1]['headers'], {'If-None-Match': '"v1"'})
+        self.assertEqual(self.tracer.summary()['saved_bytes'], body_size)
+
+        # The lifetime of the entry is extended
+        self.assertEqual(self.client.video(2248791), self.video['data'])
+        self.assertEqual(self.session.get.call_count, 2)
+
+
+class CatalogueTestCase(unittest.TestCase):
+
+    def setUp(self):
+        print("Running test: {0}".format(self.id().split('.')[-1]))
+
+        self.catalogue_file = os.path.join(temp_dir, 'catalogue_test.db')
+        self.catalogue = Catalogue(self.catalogue_file)
+
+    def tearDown(self):
+        self.catalogue.close()
+        os.remove(self.catalogue_file)
+
+    @staticmethod
+    def _brand(brand_id, title, tags=None, people=None):
+        terms = {Catalogue.title_weight: [title],
+                 Catalogue.tag_weight: tags or [],
+                 Catalogue.people_weight: people or [],
+                 }
+        return {'id': brand_id, 'title': title}, terms
+
+    def _search(self, keyword, limit=20, offset=0):
+        return [brand_info['id'] for brand_info in self.catalogue.search(keyword, limit, offset)['data']]
+
+    def test_01_normalization(self):
+        self.catalogue.add_brands([self._brand(1, 'Ёлки-3'), self._brand(2, 'Вечный отпуск')], 1)
+
+        self.assertEqual(self._search('елки'), [1])
+        self.assertEqual(self._search('ЁЛКИ'), [1])
+        self.assertEqual(self._search('ВЕЧНЫЙ'), [2])
+
+    def test_02_prefix_words(self):
+        self.catalogue.add_brands([self._brand(1, 'Тайны следствия-18'),
+                                   self._brand(2, 'Тайны Санкт-Петербурга'),
+                                   self._brand(3, 'Следствие любви'),
+                                   ], 1)
+
+        self.assertEqual(self._search('тайн след'), [1])
+        self.assertEqual(self._search('след'), [1, 3])
+        self.assertEqual(self._search('тайны 19'), [])
+
+    def test_03_ranking(self):
+        self.catalogue.add_brands([self._brand(1, 'Склифосовский', people=['Максим Аверин']),
+                                   self._brand(2, 'Вызов', tags=['Детективы', 'Аверин']),
+                                   self._brand(3, 'Аверин. Документальный фильм'),
+                                   self._brand(4, 'Аверины', people=['Аверин']),
+                                   ], 1)
+
+        # Title matches go first, brands with the same score are ordered by id
+        self.assertEqual(self._search('аверин'), [3, 4, 2, 1])
+
+    def test_04_pagination(self):
+        self.catalogue.add_brands([self._brand(brand_id, 'Сериал {0}'.format(brand_id)) for brand_id in range(1, 6)], 1)
+
+        result = self.catalogue.search('сериал', 2, 1)
+        self.assertEqual([brand_info['id'] for brand_info in result['data']], [3, 4])
+        self.assertEqual(result['pagination'], {'totalCount': 5, 'limit': 2, 'offset': 1})
+
+        self.assertEqual(self._search('сериал', 2, 2), [5])
+        self.assertEqual(self._search('сериал', 2, 3), [])
+
+    def test_05_finish_update(self):
+        self.assertTrue(self.catalogue.outdated)
+
+        self.catalogue.add_brands([self._brand(1, 'Вести'), self._brand(2, 'Вести недели')], 1)
+        self.assertEqual(self.catalogue.offset, 1)
+        self.catalogue.finish_update()
+
+        # Brands, that are not seen during the next pass, are removed
+        self.catalogue.add_brands([self._brand(2, 'Вести недели')], 1)
+        self.catalogue.finish_update()
+
+        self.assertEqual(self._search('вести'), [2])
+        self.assertEqual(self.catalogue.offset, 0)
+        self.assertFalse(self.catalogue.outdated)
+
+
+class LibraryExporterTestCase(unittest.TestCase):
+
+    @classmethod
+    @mock.patch('simpleplugin.sys.argv', ['plugin://{0}/'.format(addon_name), '1', ''])
+    def setUpClass(cls):
+        BrandInfo.plugin = simplemedia.RoutedPlugin()
+        EmptyListItem.plugin = BrandInfo.plugin
+        # Routes are registered by default.py, only the STRM contents depend on them
+        LibraryExporter.plugin = mock.Mock(**{'url_for.return_value': 'plugin://{0}/videos/0/'.format(addon_name)})
+
+    def setUp(self):
+        print("Running test: {0}".format(self.id().split('.')[-1]))
+
+    @staticmethod
+    def _export(brand, videos):
+        fields = RussiaTvClient._brand_profiles[LibraryExporter.brand_profile]
+        brand = dict((name, value) for name, value in brand.items() if name in fields)
+
+        library_dir = os.path.join(temp_dir, 'library')
+        exporter = LibraryExporter(library_dir, os.path.join(temp_dir, 'library.json'))
+        with mock.patch.object(LibraryExporter, '_write') as write:
+            exporter.export_brand(brand, videos)
+
+        return dict((call[0][0], call[0][1]) for call in write.call_args_list)
+
+    def test_01_tvshow_status(self):
+        for series_is_over, status in [('false', 'Continuing'), ('true', 'Ended')]:
+            brand = dict(IncludeProfilesTestCase.brand, seriesIsOver=series_is_over)
+            files = self._export(brand, [IncludeProfilesTestCase.video])
+
+            nfo = files['TV Shows/Тайны следствия-18/tvshow.nfo']
+            self.assertIn('<status>{0}</status>'.format(status), nfo)
+
+    def test_02_same_episode_names(self):
+        videos = [IncludeProfilesTestCase.video, dict(IncludeProfilesTestCase.video, id=2248792)]
+        files = self._export(IncludeProfilesTestCase.brand, videos)
+
+        strm_files = [file_path for file_path in files if file_path.endswith('.strm')]
+        self.assertEqual(len(strm_files), 2)
+        self.assertIn('TV Shows/Тайны следствия-18/Season 18/Тайны следствия-18.s18e03 [2248792].strm', strm_files)
+
 
 if __name__ == '__main__':
     unittest.main()